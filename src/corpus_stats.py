@@ -0,0 +1,70 @@
+"""
+This module contains the document frequencies store used by tf_idf summaries: instead of computing the IDF
+on a single article, words are weighted according to how many of the summarised articles contain them.
+Words are hashed into a fixed number of buckets, therefore no vocabulary has to be built or stored.
+"""
+import logging
+import os
+import numpy as np
+
+
+class DocumentFrequencyStore:
+    """
+    Incrementally updated number of documents containing each (hashed) word
+    """
+
+    def __init__(self, n_features=2 ** 20):
+        """
+        :param n_features: number of buckets words are hashed into
+        """
+        self.n_features = n_features
+        self.document_frequencies = np.zeros(n_features, dtype=np.int32)
+        self.n_documents = 0
+
+    def add_document(self, buckets):
+        """
+        Update the statistics with a new document
+        :param buckets: hashed words of the document
+        :return:
+        """
+        self.document_frequencies[np.unique(buckets)] += 1
+        self.n_documents += 1
+
+    def get_idf(self, buckets):
+        """
+        Return the smoothed IDF of the given hashed words, computed as TfidfTransformer does
+        :param buckets: hashed words
+        :return:
+        """
+        return np.log((1 + self.n_documents) / (1 + self.document_frequencies[buckets])) + 1
+
+    def save(self, filename: str):
+        """
+        Store the statistics in the given file. The file is replaced atomically, so a crash can't corrupt it
+        :param filename: path of the .npz file
+        :return:
+        """
+        logging.info("DocumentFrequencyStore.save >>>")
+        tmp_filename = filename + ".tmp.npz"
+        np.savez(tmp_filename, document_frequencies=self.document_frequencies, n_documents=self.n_documents)
+        os.replace(tmp_filename, filename)
+        logging.info("DocumentFrequencyStore.save <<<")
+
+    @classmethod
+    def load(cls, filename: str, n_features=2 ** 20):
+        """
+        Load the statistics stored in the given file, or create new ones if it doesn't exist
+        :param filename: path of the .npz file
+        :param n_features: number of buckets, used only when the file doesn't exist
+        :return:
+        """
+        logging.info("DocumentFrequencyStore.load >>>")
+        if not os.path.exists(filename):
+            store = cls(n_features)
+        else:
+            with np.load(filename) as data:
+                store = cls(len(data['document_frequencies']))
+                store.document_frequencies = data['document_frequencies']
+                store.n_documents = int(data['n_documents'])
+        logging.info("DocumentFrequencyStore.load <<<")
+        return store
@@ -1,26 +1,246 @@
+"""
+This module contains the functions for storing and retrieving articles, summaries and feed infos.
+Two storage backends are available, chosen according to the DB filename extension:
+- TinyDB (default), where everything is kept in a single JSON file
+- SQLite (.db, .sqlite, .sqlite3), where the fields used for querying items are indexed
+"""
 from typing import List
-from tinydb import TinyDB, Query
+import argparse
+import json
 import logging
+import os
+import sqlite3
+import tempfile
+from tinydb import TinyDB, Query
+from tinydb.middlewares import CachingMiddleware
+from tinydb.storages import Storage
+from url_canonicaliser import canonicalise_url
+
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+# Field used for identifying an item when it is upserted, according to its type
+UPSERT_KEYS = {"articles": 'url', "messages": 'fn', "feeds": 'rss'}
+
+
+class AtomicJSONStorage(Storage):
+    """
+    TinyDB storage that never modifies the JSON file in place: data is written to a temporary file which then
+    replaces the original one, so a crash while writing can't leave a half-written DB
+    """
+
+    def __init__(self, path: str, **kwargs):
+        self.path = path
+        self.kwargs = kwargs
+
+    def read(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return None
+        with open(self.path, "r") as f:
+            return json.load(f)
+
+    def write(self, data):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, **self.kwargs)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def close(self):
+        pass
+
+
+class BatchMiddleware(CachingMiddleware):
+    """
+    Keep every change in memory until flush is explicitly called (or the DB is closed), so that a batch of
+    operations results in a single write
+    """
+    WRITE_CACHE_SIZE = float('inf')
+
+    def discard(self):
+        """
+        Forget all the changes that haven't been flushed yet
+        :return:
+        """
+        self.cache = None
+        self._cache_modified_count = 0
+
+
+class TinyDBStorage:
+    """
+    Storage backend where items are stored in a TinyDB JSON file
+    """
+
+    def __init__(self, filename: str):
+        self.db = TinyDB(filename, storage=BatchMiddleware(AtomicJSONStorage))
+
+    def search(self, items_to_retrieve: str):
+        """
+        Return the items of the given type
+        :param items_to_retrieve: articles, messages, sent_articles or feeds
+        :return:
+        """
+        q = Query()
+        if items_to_retrieve == "articles":
+            return self.db.search(q.title.exists())
+        elif items_to_retrieve == "messages":
+            return self.db.search(q.fn.exists())
+        elif items_to_retrieve == "sent_articles":
+            return self.db.search(q.sent == False)
+        elif items_to_retrieve == "feeds":
+            return self.db.search(q.rss.exists())
+        raise ValueError("Invalid items to retrieve: {}".format(items_to_retrieve))
+
+    def store(self, items: List[dict], items_to_store: str):
+        """
+        Insert or update the given items. The whole batch is written to disk at once: if something goes wrong no
+        change is saved
+        :param items: items to store
+        :param items_to_store: articles, messages, sent_articles or feeds
+        :return:
+        """
+        key = 'url' if items_to_store == "sent_articles" else UPSERT_KEYS[items_to_store]
+        # Index the stored documents once, instead of scanning the whole DB for each item
+        doc_ids = {}
+        for document in self.db.all():
+            if key in document:
+                doc_ids.setdefault(document[key], []).append(document.doc_id)
+        try:
+            for item in items:
+                matching_ids = doc_ids.get(item[key])
+                if items_to_store == "sent_articles":
+                    if matching_ids:
+                        self.db.update({'sent': True}, doc_ids=matching_ids)
+                elif matching_ids:
+                    self.db.update(item, doc_ids=matching_ids)
+                else:
+                    doc_ids[item[key]] = [self.db.insert(item)]
+            self.db.storage.flush()
+        except BaseException:
+            self.db.storage.discard()
+            raise
+
+    def close(self):
+        self.db.close()
+
+
+class SQLiteStorage:
+    """
+    Storage backend where items are stored in a SQLite DB. Each item is saved as a JSON document along with the
+    fields used for querying it, which are indexed. WAL mode lets other processes read the DB while the scheduler is
+    writing
+    """
+    QUERIES = {"articles": "title IS NOT NULL",
+               "messages": "fn IS NOT NULL",
+               "sent_articles": "sent = 0",
+               "feeds": "rss IS NOT NULL"}
+
+    def __init__(self, filename: str):
+        self.connection = sqlite3.connect(filename, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS items ("
+                                    "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                                    "url TEXT, fn TEXT, rss TEXT, title TEXT, sent INTEGER, "
+                                    "document TEXT NOT NULL)")
+            for column in ('url', 'fn', 'rss', 'sent'):
+                self.connection.execute("CREATE INDEX IF NOT EXISTS items_{c} ON items ({c})".format(c=column))
+
+    def search(self, items_to_retrieve: str):
+        """
+        Return the items of the given type, in insertion order
+        :param items_to_retrieve: articles, messages, sent_articles or feeds
+        :return:
+        """
+        if items_to_retrieve not in self.QUERIES:
+            raise ValueError("Invalid items to retrieve: {}".format(items_to_retrieve))
+        rows = self.connection.execute("SELECT document FROM items WHERE {} ORDER BY id".format(
+            self.QUERIES[items_to_retrieve]))
+        return [json.loads(row[0]) for row in rows]
+
+    def insert_document(self, document: dict):
+        """
+        Add a new row for the given document
+        :param document: item to add
+        :return:
+        """
+        self.connection.execute("INSERT INTO items (url, fn, rss, title, sent, document) VALUES (?, ?, ?, ?, ?, ?)",
+                                self.get_columns(document) + (json.dumps(document),))
+
+    def update_documents(self, key: str, value, fields: dict):
+        """
+        Update the documents whose key field is equal to the given value
+        :param key: indexed field used for finding the documents (url, fn or rss)
+        :param value: value the key field must have
+        :param fields: fields to add or replace in the matching documents
+        :return: number of updated documents
+        """
+        rows = self.connection.execute("SELECT id, document FROM items WHERE {} = ?".format(key), (value,)).fetchall()
+        for row_id, document in rows:
+            document = json.loads(document)
+            document.update(fields)
+            self.connection.execute("UPDATE items SET url = ?, fn = ?, rss = ?, title = ?, sent = ?, document = ? "
+                                    "WHERE id = ?",
+                                    self.get_columns(document) + (json.dumps(document), row_id))
+        return len(rows)
+
+    def store(self, items: List[dict], items_to_store: str):
+        """
+        Insert or update the given items in a single transaction
+        :param items: items to store
+        :param items_to_store: articles, messages, sent_articles or feeds
+        :return:
+        """
+        with self.connection:
+            for item in items:
+                if items_to_store == "sent_articles":
+                    self.update_documents('url', item['url'], {'sent': True})
+                else:
+                    key = UPSERT_KEYS[items_to_store]
+                    if not self.update_documents(key, item[key], item):
+                        self.insert_document(item)
+
+    @staticmethod
+    def get_columns(document: dict):
+        """
+        Return the values of the indexed columns for the given document
+        :param document: item to store
+        :return:
+        """
+        return (document.get('url'), document.get('fn'), document.get('rss'), document.get('title'),
+                document.get('sent'))
+
+    def close(self):
+        self.connection.close()
+
+
+def get_storage(filename: str):
+    """
+    Return the storage backend associated with the given DB file
+    :param filename: path where the DB is stored: SQLite is used for .db, .sqlite and .sqlite3 files, TinyDB otherwise
+    :return:
+    """
+    if os.path.splitext(filename)[1].lower() in SQLITE_EXTENSIONS:
+        return SQLiteStorage(filename)
+    return TinyDBStorage(filename)
 
 
 def retrieve_items_from_db(filename: str, items_to_retrieve: str):
     """
     Query the DB for obtaining the specified items
-    :param filename: path where TinyDB is stored
-    :param items_to_retrieve: whether to retrieve articles summarised in the past or summaries already sent via telegram
+    :param filename: path where the DB is stored
+    :param items_to_retrieve: whether to retrieve articles summarised in the past, summaries already sent via telegram
+    or the HTTP validators (ETag/Last-Modified) of the RSS feeds
     :return:
     """
     logging.info("retrieve_items_from_db >>>")
     try:
-        db = TinyDB(filename)
-        q = Query()
-        if items_to_retrieve == "articles":
-            query_result = db.search(q.title.exists())
-        elif items_to_retrieve == "messages":
-            query_result = db.search(q.fn.exists())
-        elif items_to_retrieve == "sent_articles":
-            query_result = db.search(q.sent == False)
-        db.close()
+        storage = get_storage(filename)
+        query_result = storage.search(items_to_retrieve)
+        storage.close()
     except Exception as ex:
         logging.error(ex)
         query_result = {}
@@ -28,6 +248,21 @@ def retrieve_items_from_db(filename: str, items_to_retrieve: str):
     return query_result
 
 
+def get_article_key(article: dict, fields_to_ignore: tuple):
+    """
+    Return a hashable representation of the given article, ignoring the specified fields. Articles are identified
+    by their title and canonical URL, so that the same article is recognised even if its URL has e.g. different
+    tracking parameters. Two items without URL have the same key only if all their remaining fields are equal
+    :param article: article to represent
+    :param fields_to_ignore: fields that shouldn't be considered (e.g. summary, sent, source)
+    :return:
+    """
+    if 'url' in article:
+        # Articles stored before canonical URLs were introduced don't have them
+        return article.get('title'), article.get('canonical_url') or canonicalise_url(article['url'])
+    return frozenset((k, v) for k, v in article.items() if k not in fields_to_ignore)
+
+
 def get_delta(old_items, current_items):
     """
     Find, among current items, the ones that aren't in old items
@@ -38,12 +273,12 @@ def get_delta(old_items, current_items):
     logging.info("get_delta >>>")
     if not old_items:
         return current_items
-    # Delete sent and summary fields so that the two list have the "same" fields
-    old_articles = [{k: article[k] for k in article.keys() if k != 'sent' and k != 'summary'} for article in old_items]
+    # Delete sent and summary fields so that the two list have the "same" fields: the index is built only once
+    old_articles = {get_article_key(article, ('sent', 'summary')) for article in old_items}
     delta = []
     for item in current_items:
         # Remove the "source" key as it isn't stored in the DB
-        curr_article = {k: item[k] for k in item.keys() if k != 'source'}
+        curr_article = get_article_key(item, ('source',))
         # Check if the current article was already scraped or not
         if curr_article not in old_articles:
             delta.append(item)
@@ -53,21 +288,49 @@ def get_delta(old_items, current_items):
 
 def insert_items_in_db(items: List[dict], articles_db_fn: str, items_to_store: str):
     """
-    Add the given items in the JSON "DB" file
+    Add the given items in the DB
     :param items: items used in the last execution that should be added to the given db
-    :param articles_db_fn: filename where the JSON "DB" is stored
-    :param items_to_store: whether to update articles or messages db
+    :param articles_db_fn: filename where the DB is stored
+    :param items_to_store: whether to update articles, messages or feeds db
     :return:
     """
     logging.info("insert_items_in_db >>>")
-    db = TinyDB(articles_db_fn)
-    q = Query()
-    for item in items:
-        if items_to_store == "articles":
-            db.upsert(item, q.url == item['url'])
-        elif items_to_store == "messages":
-            db.upsert(item, q.fn == item['fn'])
-        elif items_to_store == "sent_articles":
-            db.update({'sent': True}, q.url == item['url'])
-    db.close()
+    storage = get_storage(articles_db_fn)
+    try:
+        storage.store(items, items_to_store)
+    finally:
+        storage.close()
     logging.info("insert_items_in_db <<<")
+
+
+def migrate_tinydb_to_sqlite(tinydb_fn: str, sqlite_fn: str):
+    """
+    Copy all the items stored in the given TinyDB JSON file into a new SQLite DB. An existing DB containing items
+    isn't modified, so that running the migration twice doesn't duplicate them
+    :param tinydb_fn: path of the TinyDB JSON file (e.g. parsed_articles.json)
+    :param sqlite_fn: path of the SQLite DB to create or fill, if it is empty
+    :return: number of migrated items
+    """
+    logging.info("migrate_tinydb_to_sqlite >>>")
+    db = TinyDB(tinydb_fn)
+    items = db.all()
+    db.close()
+    storage = SQLiteStorage(sqlite_fn)
+    try:
+        if storage.connection.execute("SELECT COUNT(*) FROM items").fetchone()[0] > 0:
+            raise ValueError("{} already contains items: migrate into a new file".format(sqlite_fn))
+        with storage.connection:
+            for item in items:
+                storage.insert_document(dict(item))
+    finally:
+        storage.close()
+    logging.info("migrate_tinydb_to_sqlite <<<")
+    return len(items)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate a TinyDB JSON file into a SQLite DB")
+    parser.add_argument("tinydb_fn", help="TinyDB JSON file, e.g. parsed_articles.json")
+    parser.add_argument("sqlite_fn", help="SQLite DB to create, e.g. parsed_articles.sqlite")
+    args = parser.parse_args()
+    print("Migrated {} items".format(migrate_tinydb_to_sqlite(args.tinydb_fn, args.sqlite_fn)))
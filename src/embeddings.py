@@ -0,0 +1,230 @@
+"""
+This module contains the functions for converting a Word Embedding model (e.g. GloVe) into a binary format
+that can be memory-mapped. The binary model is made of two files:
+- <prefix>.vocab: one word per line, in the same order of the vectors
+- <prefix>.npy: matrix with one vector per row, stored as float32, float16 or int8
+- <prefix>.scales.npy: (only for int8 models) the scale of each vector
+Loading it is almost instantaneous and the vectors are shared among processes through the OS page cache.
+For low-memory deployments the vocabulary can also be pruned and the vectors quantised.
+"""
+from collections.abc import Mapping
+import argparse
+import logging
+import os
+import numpy as np
+
+
+class EmbeddingStore(Mapping):
+    """
+    Read-only mapping from words to float32 vectors, backed by a (memory-mapped) matrix. It can be used wherever a
+    dictionary of word vectors is expected, e.g. as model of word_mover_distance.model.WordEmbedding.
+    Quantised vectors are transparently converted back to float32
+    """
+
+    def __init__(self, words, vectors, scales=None):
+        self.words = words
+        self.vectors = vectors
+        self.scales = scales
+        self.index = {word: i for i, word in enumerate(words)}
+
+    def __getitem__(self, word):
+        row = self.index[word]
+        vector = np.asarray(self.vectors[row], dtype=np.float32)
+        if self.scales is not None:
+            vector = vector * self.scales[row]
+        return vector
+
+    def __contains__(self, word):
+        return word in self.index
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def __len__(self):
+        return len(self.words)
+
+
+def load_text_embedding(model_fn: str, encoding='utf-8'):
+    """
+    Load a Word Embedding model stored as text (one word followed by its vector per line, as in GloVe)
+    :param model_fn: path of the text model
+    :param encoding: encoding of the text model
+    :return:
+    """
+    logging.info("load_text_embedding >>>")
+    words = []
+    vectors = []
+    with open(model_fn, 'r', encoding=encoding) as f:
+        for line in f:
+            values = line.split()
+            words.append(values[0])
+            vectors.append(np.asarray(values[1:], "float32"))
+    logging.info("load_text_embedding <<<")
+    return EmbeddingStore(words, np.vstack(vectors))
+
+
+def save_binary_embedding(model: EmbeddingStore, output_prefix: str):
+    """
+    Store the given model in the binary format
+    :param model: model to store
+    :param output_prefix: path, without extension, of the binary model to create
+    :return:
+    """
+    logging.info("save_binary_embedding >>>")
+    np.save(output_prefix + ".npy", model.vectors)
+    if model.scales is not None:
+        np.save(output_prefix + ".scales.npy", model.scales)
+    elif os.path.exists(output_prefix + ".scales.npy"):
+        os.remove(output_prefix + ".scales.npy")
+    with open(output_prefix + ".vocab", 'w', encoding='utf-8') as f:
+        f.write("\n".join(model.words))
+    logging.info("save_binary_embedding <<<")
+
+
+def convert_text_embedding(model_fn: str, output_prefix: str, encoding='utf-8'):
+    """
+    Convert a Word Embedding model stored as text into the binary format
+    :param model_fn: path of the text model
+    :param output_prefix: path, without extension, of the binary model to create
+    :param encoding: encoding of the text model
+    :return: number of converted words
+    """
+    logging.info("convert_text_embedding >>>")
+    model = load_text_embedding(model_fn, encoding)
+    save_binary_embedding(model, output_prefix)
+    logging.info("convert_text_embedding <<<")
+    return len(model)
+
+
+def load_binary_embedding(model_prefix: str):
+    """
+    Memory-map the binary Word Embedding model with the given prefix
+    :param model_prefix: path of the binary model, with or without the .npy extension
+    :return:
+    """
+    logging.info("load_binary_embedding >>>")
+    if model_prefix.endswith(".npy"):
+        model_prefix = model_prefix[:-len(".npy")]
+    vectors = np.load(model_prefix + ".npy", mmap_mode='r')
+    scales = None
+    if os.path.exists(model_prefix + ".scales.npy"):
+        scales = np.load(model_prefix + ".scales.npy", mmap_mode='r')
+    with open(model_prefix + ".vocab", 'r', encoding='utf-8') as f:
+        words = f.read().split("\n")
+    logging.info("load_binary_embedding <<<")
+    return EmbeddingStore(words, vectors, scales)
+
+
+def load_embedding(model_fn: str):
+    """
+    Load the given Word Embedding model, either binary (.npy) or text
+    :param model_fn: path of the model
+    :return:
+    """
+    if model_fn.endswith(".npy"):
+        return load_binary_embedding(model_fn)
+    return load_text_embedding(model_fn)
+
+
+def get_corpus_words(corpus_fn: str):
+    """
+    Return the words of the given corpus that survive text preprocessing, i.e. the only ones that
+    summarisation algorithms look up in the Word Embedding model
+    :param corpus_fn: text file, e.g. a collection of articles
+    :return:
+    """
+    logging.info("get_corpus_words >>>")
+    # Imported here so that converting a model doesn't require the summarisation dependencies
+    import summariser
+    with open(corpus_fn, 'r', encoding='utf-8') as f:
+        sentences = summariser.split_text_into_sentences(f.read())
+    stopws = summariser.load_stop_words()
+    lemmatiser = summariser.initialise_lemmatiser()
+    words = set()
+    for sentence in sentences:
+        words.update(summariser.preprocess_text(sentence, stopws, lemmatiser))
+    logging.info("get_corpus_words <<<")
+    return words
+
+
+def quantise_vectors(vectors, dtype: str):
+    """
+    Quantise the given vectors
+    :param vectors: float matrix with one vector per row
+    :param dtype: float16, or int8 for storing each vector as 8 bit integers along with its own scale
+    :return: quantised vectors and their scales (None for float16)
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    elif dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1
+        quantised_vectors = np.round(vectors / scales[:, np.newaxis]).astype(np.int8)
+        return quantised_vectors, scales.astype(np.float32)
+    raise ValueError("Invalid dtype: it should be float16 or int8")
+
+
+def compact_embedding(model: EmbeddingStore, corpus_words: set, top_k: int, dtype: str):
+    """
+    Create a smaller version of the given model, keeping only the words in the corpus along with the top_k most
+    frequent words, and quantising their vectors
+    :param model: model to compact
+    :param corpus_words: words that must be kept
+    :param top_k: number of most frequent words to keep. Words in GloVe models are sorted by frequency, therefore
+    these are the first top_k words
+    :param dtype: float16 or int8
+    :return: the compact model and a report with the memory saved and the approximation error
+    """
+    logging.info("compact_embedding >>>")
+    rows = [i for i, word in enumerate(model.words) if i < top_k or word in corpus_words]
+    original_vectors = np.asarray(model.vectors[rows], dtype=np.float32)
+    if model.scales is not None:
+        original_vectors = original_vectors * np.asarray(model.scales[rows])[:, np.newaxis]
+    vectors, scales = quantise_vectors(original_vectors, dtype)
+    compact_model = EmbeddingStore([model.words[i] for i in rows], vectors, scales)
+    restored_vectors = vectors.astype(np.float32)
+    if scales is not None:
+        restored_vectors = restored_vectors * scales[:, np.newaxis]
+    norms = np.linalg.norm(original_vectors, axis=1) * np.linalg.norm(restored_vectors, axis=1)
+    norms[norms == 0] = 1
+    cosine_similarities = np.sum(original_vectors * restored_vectors, axis=1) / norms
+    original_bytes = np.asarray(model.vectors).nbytes + (0 if model.scales is None else model.scales.nbytes)
+    compact_bytes = vectors.nbytes + (0 if scales is None else scales.nbytes)
+    report = {"original_words": len(model),
+              "compact_words": len(compact_model),
+              "original_bytes": original_bytes,
+              "compact_bytes": compact_bytes,
+              "saved_bytes": original_bytes - compact_bytes,
+              "mean_cosine_similarity": float(np.mean(cosine_similarities)) if rows else 1.0,
+              "min_cosine_similarity": float(np.min(cosine_similarities)) if rows else 1.0,
+              "max_absolute_error": float(np.max(np.abs(original_vectors - restored_vectors))) if rows else 0.0}
+    logging.info("compact_embedding <<<")
+    return compact_model, report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a text Word Embedding model (e.g. GloVe) into a "
+                                                 "memory-mappable binary model, optionally pruned and quantised")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="convert a text model into a binary one")
+    convert_parser.add_argument("model_fn", help="text model, e.g. glove.6B.50d.txt")
+    convert_parser.add_argument("output_prefix", help="binary model path without extension, e.g. glove.6B.50d")
+    compact_parser = subparsers.add_parser("compact", help="create a pruned and quantised binary model")
+    compact_parser.add_argument("model_fn", help="text or binary (.npy) model, e.g. glove.6B.50d.txt")
+    compact_parser.add_argument("output_prefix", help="binary model path without extension")
+    compact_parser.add_argument("--corpus", help="text file whose words must be kept, e.g. a dump of articles")
+    compact_parser.add_argument("--top_k", type=int, default=50000, help="number of most frequent words to keep")
+    compact_parser.add_argument("--dtype", choices=["float16", "int8"], default="int8")
+    args = parser.parse_args()
+    if args.command == "convert":
+        print("Converted {} words".format(convert_text_embedding(args.model_fn, args.output_prefix)))
+    else:
+        words_to_keep = get_corpus_words(args.corpus) if args.corpus else set()
+        compact_model, compact_report = compact_embedding(load_embedding(args.model_fn),
+                                                          words_to_keep,
+                                                          args.top_k,
+                                                          args.dtype)
+        save_binary_embedding(compact_model, args.output_prefix)
+        for key, value in compact_report.items():
+            print("{}: {}".format(key, value))
@@ -1,40 +1,129 @@
+from concurrent.futures import ThreadPoolExecutor
 import feedparser
 import logging
+import time
+import requests
 import database_io
+from url_canonicaliser import canonicalise_url
 
+FEED_CHUNK_BYTES = 16384
 
-def get_website_article_link_title(feed_name, website, articles_infos):
+
+def get_website_article_link_title(feed_name, website, articles_infos, timeout=10, validators=None):
     """
     Given a RSS Feed link return the current article with their titles and links
     :param feed_name: RSS Feed URL
     :param website: name of the website
     :param articles_infos: list where parsed articles will be stored
+    :param timeout: maximum number of seconds to wait for the whole RSS feed to be downloaded
+    :param validators: dictionary, indexed by feed URL, with the ETag and Last-Modified values obtained in the last
+    poll and the entries parsed then. If given, the values are sent back to the server and the feed is parsed only
+    if it has changed, otherwise the stored entries are returned: the entry of the current feed is updated with the
+    new values
     :return:
     """
     logging.info("get_website_article_link_title >>>")
-    feed = feedparser.parse(feed_name)
+    headers = {}
+    # Entries of a not modified feed are returned again, so that articles not summarised yet (e.g. because scraping
+    # failed) are retried: already summarised ones are filtered out by get_delta
+    if validators is not None and 'entries' in validators.get(feed_name, {}):
+        if validators[feed_name].get('etag'):
+            headers['If-None-Match'] = validators[feed_name]['etag']
+        if validators[feed_name].get('modified'):
+            headers['If-Modified-Since'] = validators[feed_name]['modified']
+    # requests timeout applies to each read: a feed sent a few bytes at a time is aborted after the deadline
+    deadline = time.monotonic() + timeout
+    with requests.get(feed_name, timeout=timeout, headers=headers, stream=True) as response:
+        if response.status_code == 304:
+            logging.info("{} feed has not changed since the last poll".format(website))
+            for entry in validators[feed_name]['entries']:
+                articles_infos.append({'title': entry['title'], 'url': entry['url'], 'source': website})
+            logging.info("get_website_article_link_title <<<")
+            return articles_infos
+        response.raise_for_status()
+        content = bytearray()
+        for chunk in response.iter_content(chunk_size=FEED_CHUNK_BYTES):
+            content.extend(chunk)
+            if time.monotonic() > deadline:
+                raise TimeoutError("{} feed took more than {} seconds to download".format(website, timeout))
+    # Headers are used by feedparser for detecting the encoding of the feed
+    feed = feedparser.parse(bytes(content), response_headers=response.headers)
+    entries = []
     for i in range(0, len(feed.entries)):
         title = feed.entries[i].title
         url = feed.entries[i].link
         current_article = {'title': title, 'url': url, 'source': website}
         articles_infos.append(current_article)
+        entries.append({'title': title, 'url': url})
+    if validators is not None:
+        validators[feed_name] = {'rss': feed_name,
+                                 'etag': response.headers.get('ETag'),
+                                 'modified': response.headers.get('Last-Modified'),
+                                 'entries': entries}
     logging.info("get_website_article_link_title <<<")
     return articles_infos
 
 
-def get_feeds_articles(news_dict, old_articles: list):
+def remove_duplicated_articles(articles_infos: list):
+    """
+    Remove the articles linked more than once, e.g. by several feeds or with different tracking parameters.
+    Articles are identified by their title and canonical URL, as already summarised articles are.
+    The canonical URL of each article is added to its fields
+    :param articles_infos: list of articles
+    :return: articles whose title and canonical URL haven't been seen before, in the original order
+    """
+    unique_articles = []
+    article_keys = set()
+    for article in articles_infos:
+        article['canonical_url'] = canonicalise_url(article['url'])
+        article_key = (article['title'], article['canonical_url'])
+        if article_key not in article_keys:
+            article_keys.add(article_key)
+            unique_articles.append(article)
+    if len(unique_articles) < len(articles_infos):
+        logging.info("{} duplicated articles removed".format(len(articles_infos) - len(unique_articles)))
+    return unique_articles
+
+
+def get_feeds_articles(news_dict, old_articles: list, max_workers=8, timeout=10, feed_cache_fn=None):
     """
-    Return the link and title of articles in the given RSS feeds that have not yet been summarised
+    Return the link and title of articles in the given RSS feeds that have not yet been summarised.
+    Feeds are downloaded concurrently: a feed that can't be downloaded or parsed is skipped
+    without affecting the others. Articles with the same title and canonical URL are returned only once.
     :param news_dict: Dictionaries where websites infos such as feed URL are stored
     :param old_articles: List of already read articles
+    :param max_workers: maximum number of feeds downloaded at the same time
+    :param timeout: maximum number of seconds to wait for each feed
+    :param feed_cache_fn: path of the DB where ETag and Last-Modified values of each feed, along with its entries,
+    are stored. If None, feeds are always downloaded and parsed
     :return:
     """
     logging.info("get_feeds_articles >>>")
     articles_infos = []
-    for website in news_dict.keys():
-        website_rss = news_dict[website]['rss']
-        articles_infos = get_website_article_link_title(website_rss, website, articles_infos)
+    validators = None
+    if feed_cache_fn:
+        validators = {item['rss']: item for item in database_io.retrieve_items_from_db(feed_cache_fn, "feeds")}
+    old_validators = dict(validators) if validators else {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        # Each feed gets its own list, so that results can be merged following websites.json order
+        futures = {website: executor.submit(get_website_article_link_title,
+                                            news_dict[website]['rss'],
+                                            website,
+                                            [],
+                                            timeout,
+                                            validators)
+                   for website in news_dict.keys()}
+        for website, future in futures.items():
+            try:
+                articles_infos.extend(future.result())
+            except Exception as ex:
+                logging.error("Unable to get articles from {} feed".format(website))
+                logging.error(ex)
+    if feed_cache_fn:
+        updated_validators = [v for rss, v in validators.items() if old_validators.get(rss) != v]
+        if updated_validators:
+            database_io.insert_items_in_db(updated_validators, feed_cache_fn, "feeds")
+    articles_infos = remove_duplicated_articles(articles_infos)
     articles_to_summarise = database_io.get_delta(old_articles, articles_infos)
     logging.info("get_feeds_articles <<<")
     return articles_to_summarise
-
@@ -0,0 +1,166 @@
+"""
+This module keeps track of how each host behaves when its articles are downloaded, so that slow or broken websites
+don't slow down the whole run. For each host the latency and the outcome of the last requests are kept:
+- timeouts are derived from the observed latencies instead of being fixed
+- after several consecutive failures the host circuit opens and its articles are skipped until a cool-down has
+  passed. Then a single request is attempted: if it succeeds the circuit closes, otherwise it opens again
+"""
+from collections import deque
+import logging
+import threading
+import time
+import numpy as np
+
+
+class HostHealth:
+    """
+    Latencies and outcomes of the last requests made to a host, along with the state of its circuit
+    """
+
+    def __init__(self, window_size: int):
+        self.latencies = deque(maxlen=window_size)
+        self.outcomes = deque(maxlen=window_size)
+        self.consecutive_failures = 0
+        # Time when the circuit opened, None if it is closed
+        self.opened_at = None
+        self.trial_in_progress = False
+
+
+class HostHealthTracker:
+    """
+    Thread-safe health of all the hosts
+    """
+
+    def __init__(self,
+                 failure_threshold=3,
+                 cool_down_seconds=1800,
+                 default_timeout=3,
+                 max_timeout=10,
+                 min_timeout=1,
+                 latency_percentile=95,
+                 timeout_multiplier=2,
+                 min_samples=5,
+                 window_size=50):
+        """
+        :param failure_threshold: number of consecutive failures after which the circuit of a host opens
+        :param cool_down_seconds: number of seconds to wait before trying again a host whose circuit is open
+        :param default_timeout: timeout used until enough latencies of a host are known
+        :param max_timeout: maximum timeout, whatever the observed latencies
+        :param min_timeout: minimum timeout, whatever the observed latencies
+        :param latency_percentile: percentile of the observed latencies used for computing the timeout
+        :param timeout_multiplier: the timeout is the latency percentile multiplied by this value
+        :param min_samples: number of latencies needed before deriving the timeout from them
+        :param window_size: number of requests to each host taken into account
+        """
+        self.failure_threshold = failure_threshold
+        self.cool_down_seconds = cool_down_seconds
+        self.default_timeout = default_timeout
+        self.max_timeout = max_timeout
+        self.min_timeout = min_timeout
+        self.latency_percentile = latency_percentile
+        self.timeout_multiplier = timeout_multiplier
+        self.min_samples = min_samples
+        self.window_size = window_size
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def get_host_health(self, host: str):
+        """
+        Return the health of the given host, creating it if needed. It must be called while holding the lock
+        :param host: host to check
+        :return:
+        """
+        if host not in self.hosts:
+            self.hosts[host] = HostHealth(self.window_size)
+        return self.hosts[host]
+
+    def is_available(self, host: str):
+        """
+        Return whether a request can be made to the given host, i.e. its circuit is closed or its cool-down has passed
+        :param host: host to check
+        :return:
+        """
+        with self.lock:
+            health = self.get_host_health(host)
+            if health.opened_at is None:
+                return True
+            if health.trial_in_progress or time.monotonic() - health.opened_at < self.cool_down_seconds:
+                return False
+            # Half open: only one request is attempted
+            health.trial_in_progress = True
+            return True
+
+    def get_timeout(self, host: str):
+        """
+        Return the number of seconds to wait for the given host
+        :param host: host to request
+        :return:
+        """
+        with self.lock:
+            latencies = list(self.get_host_health(host).latencies)
+        if len(latencies) < self.min_samples:
+            return self.default_timeout
+        timeout = np.percentile(latencies, self.latency_percentile) * self.timeout_multiplier
+        return float(np.clip(timeout, self.min_timeout, self.max_timeout))
+
+    def record_success(self, host: str, latency: float):
+        """
+        Record a successful request, closing the host circuit
+        :param host: requested host
+        :param latency: number of seconds the request took
+        :return:
+        """
+        with self.lock:
+            health = self.get_host_health(host)
+            health.latencies.append(latency)
+            health.outcomes.append(True)
+            health.consecutive_failures = 0
+            if health.opened_at is not None:
+                logging.info("Circuit of {} closed".format(host))
+            health.opened_at = None
+            health.trial_in_progress = False
+
+    def record_failure(self, host: str):
+        """
+        Record a failed request, opening the host circuit if it failed too many times in a row
+        :param host: requested host
+        :return:
+        """
+        with self.lock:
+            health = self.get_host_health(host)
+            health.outcomes.append(False)
+            health.consecutive_failures += 1
+            if health.trial_in_progress or health.consecutive_failures >= self.failure_threshold:
+                if health.opened_at is None or health.trial_in_progress:
+                    logging.warning("Circuit of {} opened after {} consecutive failures: its articles will be "
+                                    "skipped for {} seconds".format(host,
+                                                                    health.consecutive_failures,
+                                                                    self.cool_down_seconds))
+                health.opened_at = time.monotonic()
+                health.trial_in_progress = False
+
+    def end_trial(self, host: str):
+        """
+        Allow another request to a host whose circuit is half open, when the attempted one had no outcome
+        :param host: requested host
+        :return:
+        """
+        with self.lock:
+            self.get_host_health(host).trial_in_progress = False
+
+    def get_report(self):
+        """
+        Return the health of each host: number of requests, error rate, median and 95th percentile latency, and
+        whether the circuit is open
+        :return:
+        """
+        with self.lock:
+            report = {}
+            for host, health in self.hosts.items():
+                report[host] = {"requests": len(health.outcomes),
+                                "error_rate": float(1 - np.mean(health.outcomes)) if health.outcomes else 0.0,
+                                "median_latency": float(np.median(health.latencies)) if health.latencies else None,
+                                "p95_latency": float(np.percentile(health.latencies, 95)) if health.latencies
+                                else None,
+                                "circuit_open": health.opened_at is not None}
+            return report
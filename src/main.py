@@ -9,12 +9,19 @@ import schedule
 import feed
 import summariser
 import scraper
+from page_cache import PageCache
+from host_health import HostHealthTracker
 import database_io
 import telegram_bot
-import transformers_summaries
+from model_registry import ModelRegistry
 from flask import Flask, render_template, request
 
-global MODEL
+global MODEL_REGISTRY
+# Health of the websites, kept among runs
+HOST_HEALTH = None
+# Transformers texts are summarised once this number of batches is pending, so that they can be grouped by length
+# (see generate_transformers_summaries) instead of following the order in which downloads finish
+TRANSFORMERS_PENDING_BATCHES = 4
 
 
 def summarise_new_articles():
@@ -22,46 +29,95 @@ def summarise_new_articles():
     Start the summarisation process according the config files
     :return:
     """
+    global HOST_HEALTH
     logging.info("summarise_new_articles >>>")
     # Get the list of articles summarised in the past
     db_path = settings['db_path']
     old_articles = database_io.retrieve_items_from_db(db_path, "articles")
-    articles_infos = feed.get_feeds_articles(website_infos, old_articles)
+    articles_infos = feed.get_feeds_articles(website_infos,
+                                             old_articles,
+                                             settings.get('feed_workers', 8),
+                                             settings.get('feed_timeout', 10),
+                                             settings.get('feed_cache_path'))
+    page_cache = None
+    if settings.get('page_cache_dir'):
+        ttl_hours = settings.get('page_cache_ttl_hours', 72)
+        max_mb = settings.get('page_cache_max_mb', 500)
+        page_cache = PageCache(settings['page_cache_dir'],
+                               ttl_hours * 3600 if ttl_hours else None,
+                               max_mb * 1024 * 1024 if max_mb is not None else None)
+    if HOST_HEALTH is None:
+        HOST_HEALTH = HostHealthTracker(settings.get('circuit_breaker_failures', 3),
+                                        settings.get('circuit_breaker_cool_down_minutes', 30) * 60,
+                                        settings.get('scraper_timeout', 3),
+                                        settings.get('scraper_max_timeout', 10))
     summaries = []
-
-    for article in articles_infos:
-        source = article['source']
-        main_div_class = website_infos[source]['main_class']
-        article_url = article['url']
-        logging.debug("source: {source}, url: {url}".format(source=source, url=article_url))
-        text = scraper.scrape_page(article_url,
-                                   main_div_class,
-                                   website_infos[source]['number_of_first_paragraphs_to_ignore'],
-                                   website_infos[source]['number_of_last_paragraphs_to_ignore'])
-
-        if text:
-            try:
-                article_summary = summariser.create_summary(text, MODEL, settings)
-                current_article_summary = {
-                    "title": article['title'],
-                    "summary": article_summary,
-                    "url": article_url,
-                    "sent": False}
-                if current_article_summary:
-                    summaries.append(current_article_summary)
-            except Exception as ex:
-                logging.error("Unable to summarise %s", article_url)
-                logging.error(ex)
+    # Scraped articles and their texts waiting to be summarised, grouped by the algorithm used for summarising them
+    pending_articles = {}
+    # Articles are summarised while the remaining ones are being downloaded
+    for article, text in scraper.scrape_pages(articles_infos,
+                                              website_infos,
+                                              settings.get('scraper_workers', 8),
+                                              settings.get('scraper_workers_per_host', 2),
+                                              settings.get('html_parser', 'html.parser'),
+                                              settings.get('max_page_bytes'),
+                                              page_cache,
+                                              HOST_HEALTH):
+        if not text:
+            continue
+        # Each website can use its own algorithm instead of the default one
+        algorithm = website_infos[article['source']].get('algorithm', settings['algorithm'])
+        pending_articles.setdefault(algorithm, []).append((article, text))
+        # Transformers summarise articles in batches, the other algorithms one at a time
+        if algorithm in ("bart", "t5"):
+            pending_size = settings.get('transformers_batch_size', 8) * TRANSFORMERS_PENDING_BATCHES
+        else:
+            pending_size = 1
+        if len(pending_articles[algorithm]) >= pending_size:
+            summaries.extend(summarise_articles(pending_articles.pop(algorithm), algorithm))
+    for algorithm, articles_texts in pending_articles.items():
+        summaries.extend(summarise_articles(articles_texts, algorithm))
+    for host, host_report in HOST_HEALTH.get_report().items():
+        logging.info("{}: {}".format(host, host_report))
     logging.info("Finished to summarise articles!")
     # Update DB only if there are new summaries
     if summaries:
         database_io.insert_items_in_db(summaries, db_path, "articles")
+        MODEL_REGISTRY.save_statistics()
         logging.info("Articles db updated!")
     if settings['send_summaries_via_telegram']:
         telegram_bot.send_summaries(settings)
     logging.info("summarise_new_articles <<<")
 
 
+def summarise_articles(articles_texts: list, algorithm: str):
+    """
+    Summarise the given articles with the given algorithm
+    :param articles_texts: list of (article, text) pairs
+    :param algorithm: algorithm to use, instead of the one in settings
+    :return: summaries to store in the DB
+    """
+    algorithm_settings = dict(settings, algorithm=algorithm)
+    model = MODEL_REGISTRY.get_model(algorithm_settings)
+    articles_summaries = summariser.create_summaries([text for _, text in articles_texts],
+                                                     model,
+                                                     algorithm_settings,
+                                                     update_document_frequencies=True)
+    summaries = []
+    for (article, _), article_summary in zip(articles_texts, articles_summaries):
+        if article_summary is None:
+            logging.error("Unable to summarise %s", article['url'])
+            continue
+        current_article_summary = {
+            "title": article['title'],
+            "summary": article_summary,
+            "url": article['url'],
+            "canonical_url": article['canonical_url'],
+            "sent": False}
+        summaries.append(current_article_summary)
+    return summaries
+
+
 def activate_endpoint(settings):
     # start flask
     app = Flask(__name__)
@@ -71,33 +127,29 @@ def activate_endpoint(settings):
     def home():
         return render_template('homepage.html')
 
-    # Summarisation endpoint
+    # Summarisation endpoint. The algorithm can be chosen by each request, otherwise the default one is used
     @app.route('/', methods=['POST'])
     def get_data():
         raw_text = request.form['rawtext']
+        request_settings = dict(settings, algorithm=request.form.get('algorithm') or settings['algorithm'])
         split_text = summariser.split_text_into_sentences(raw_text)
+        model = MODEL_REGISTRY.get_model(request_settings)
         return render_template("homepage.html",
-                               summary=str(summariser.create_summary(split_text, MODEL, settings)))
+                               summary=str(summariser.create_summary(split_text, model, request_settings)))
 
     return app
 
 
 def load_model(settings):
-    global MODEL
-    algorithm = settings['algorithm']
-    if algorithm == "pagerank":
-        import word_mover_distance.model as model
-        we = model.WordEmbedding(model_fn=settings['word_embedding_fn'])
-        empty_strategy = None
-        if 'empty_strategy' in settings.keys():
-            empty_strategy = settings['empty_strategy']
-        MODEL = {"distance_metric": settings['distance_metric'],
-                 "model_object": we,
-                 "empty_strategy": empty_strategy}
-    elif algorithm == "t5" or algorithm == "bart":
-        MODEL = transformers_summaries.load_transformer_model()
-    else:
-        MODEL = None
+    """
+    Create the registry of the models and load the one of the default algorithm, so that processes created later
+    (e.g. the one of the endpoint) inherit it already loaded. Models of other algorithms are loaded when needed
+    :param settings: Dictionary with summarisation settings to use
+    :return:
+    """
+    global MODEL_REGISTRY
+    MODEL_REGISTRY = ModelRegistry(settings.get('model_memory_budget_mb'))
+    MODEL_REGISTRY.get_model(settings)
 
 
 def run_backend():
@@ -0,0 +1,180 @@
+"""
+This module contains the registry of the models used for summarising articles. Models are identified by the
+algorithm and the model id (e.g. the Word Embedding file or the transformers checkpoint), loaded only when they are
+first needed and warmed up with a short summary. If a memory budget is specified, the least recently used models
+are evicted when it is exceeded, so that e.g. GloVe, BART and T5 can be used by different feeds or requests.
+"""
+from collections import OrderedDict
+import logging
+import threading
+import embeddings
+import summariser
+import transformers_summaries
+from corpus_stats import DocumentFrequencyStore
+
+WARM_UP_TEXT = ["This is a short sentence used for warming up the summarisation model.",
+                "The first summary is usually slower than the following ones, therefore it is created in advance."]
+
+# Approximate memory used by each entry of a dictionary-based Word Embedding model (key, array object, ...)
+EMBEDDING_ENTRY_OVERHEAD_BYTES = 200
+
+
+def get_model_key(settings: dict):
+    """
+    Return the key identifying the model needed by the given settings, i.e. the algorithm and the model id
+    :param settings: Dictionary with summarisation settings to use
+    :return:
+    """
+    algorithm = settings['algorithm']
+    model_id = None
+    if algorithm == "pagerank":
+        model_id = "{}|{}".format(settings['word_embedding_fn'], settings['distance_metric'])
+    elif algorithm == "tf_idf":
+        model_id = settings.get('idf_store_path')
+    elif algorithm == "t5" or algorithm == "bart":
+        model_id = settings.get('transformers_model_ids', {}).get(algorithm) or \
+            transformers_summaries.DEFAULT_MODEL_IDS[algorithm]
+    return algorithm, model_id
+
+
+def load_model(settings: dict):
+    """
+    Load the model needed by the given settings
+    :param settings: Dictionary with summarisation settings to use
+    :return:
+    """
+    logging.info("load_model >>>")
+    algorithm = settings['algorithm']
+    if algorithm == "pagerank":
+        import word_mover_distance.model as model
+        # Binary models are memory-mapped, text ones are entirely parsed and loaded in memory
+        if settings['word_embedding_fn'].endswith(".npy"):
+            we = model.WordEmbedding(model=embeddings.load_binary_embedding(settings['word_embedding_fn']))
+        else:
+            we = model.WordEmbedding(model_fn=settings['word_embedding_fn'])
+        loaded_model = {"distance_metric": settings['distance_metric'],
+                        "model_object": we,
+                        "empty_strategy": settings.get('empty_strategy'),
+                        "wmd_workers": settings.get('wmd_workers', 1),
+                        "wmd_tolerance": settings.get('wmd_tolerance')}
+    elif algorithm == "tf_idf" and settings.get('idf_store_path'):
+        # IDF is computed on all the summarised articles instead of a single one
+        loaded_model = {"document_frequencies": DocumentFrequencyStore.load(settings['idf_store_path']),
+                        "idf_store_path": settings['idf_store_path']}
+    elif algorithm == "t5" or algorithm == "bart":
+        loaded_model = transformers_summaries.load_transformer_model(algorithm,
+                                                                     get_model_key(settings)[1],
+                                                                     settings.get('transformers_cpu_mode', False),
+                                                                     settings.get('torch_threads'),
+                                                                     settings.get('torch_interop_threads'))
+    else:
+        loaded_model = None
+    logging.info("load_model <<<")
+    return loaded_model
+
+
+def estimate_model_size(model):
+    """
+    Return the approximate number of bytes used by the given model
+    :param model: model returned by load_model
+    :return:
+    """
+    if model is None:
+        return 0
+    if isinstance(model, dict):
+        size = 0
+        if 'model_object' in model:
+            word_vectors = model['model_object'].model
+            if isinstance(word_vectors, embeddings.EmbeddingStore):
+                size += word_vectors.vectors.nbytes
+            elif len(word_vectors) > 0:
+                vector_size = next(iter(word_vectors.values())).nbytes
+                size += len(word_vectors) * (vector_size + EMBEDDING_ENTRY_OVERHEAD_BYTES)
+        if 'document_frequencies' in model:
+            size += model['document_frequencies'].document_frequencies.nbytes
+        return size
+    # transformers pipeline
+    parameters = getattr(getattr(model, 'model', None), 'parameters', None)
+    if parameters is None:
+        return 0
+    return sum(parameter.numel() * parameter.element_size() for parameter in parameters())
+
+
+def save_model_statistics(model):
+    """
+    Store the statistics updated while summarising articles, if the model has any
+    :param model: model returned by load_model
+    :return:
+    """
+    if isinstance(model, dict) and 'document_frequencies' in model:
+        model['document_frequencies'].save(model['idf_store_path'])
+
+
+class ModelRegistry:
+    """
+    Lazily loaded models, evicted following a LRU policy when the memory budget is exceeded
+    """
+
+    def __init__(self, memory_budget_mb=None):
+        """
+        :param memory_budget_mb: maximum number of MB used by loaded models. If None, models are never evicted.
+        The model in use is never evicted, even if it exceeds the budget on its own
+        """
+        self.memory_budget = None if memory_budget_mb is None else memory_budget_mb * 1024 * 1024
+        # Model key -> (model, size in bytes), from the least to the most recently used
+        self.models = OrderedDict()
+        # Flask may serve requests from several threads
+        self.lock = threading.Lock()
+
+    def get_model(self, settings: dict):
+        """
+        Return the model needed by the given settings, loading it if it isn't already available
+        :param settings: Dictionary with summarisation settings to use
+        :return:
+        """
+        key = get_model_key(settings)
+        with self.lock:
+            if key in self.models:
+                self.models.move_to_end(key)
+                return self.models[key][0]
+            logging.info("Loading model {}".format(key))
+            model = load_model(settings)
+            self.warm_up(model, settings)
+            self.models[key] = (model, estimate_model_size(model))
+            self.evict()
+            return model
+
+    def save_statistics(self):
+        """
+        Store the statistics updated by the loaded models, e.g. document frequencies
+        :return:
+        """
+        with self.lock:
+            for model, _ in self.models.values():
+                save_model_statistics(model)
+
+    @staticmethod
+    def warm_up(model, settings: dict):
+        """
+        Create a short summary, so that lazy initialisations don't slow down the first real summary
+        :param model: model to warm up
+        :param settings: Dictionary with summarisation settings to use
+        :return:
+        """
+        try:
+            summariser.create_summary(WARM_UP_TEXT, model, dict(settings, min_words_in_sentence=1))
+        except Exception as ex:
+            logging.warning("Unable to warm up the {} model".format(settings['algorithm']))
+            logging.warning(ex)
+
+    def evict(self):
+        """
+        Remove the least recently used models until the memory budget is respected
+        :return:
+        """
+        if self.memory_budget is None:
+            return
+        while len(self.models) > 1 and sum(size for _, size in self.models.values()) > self.memory_budget:
+            key, (model, _) = self.models.popitem(last=False)
+            logging.info("Evicting model {}".format(key))
+            save_model_statistics(model)
@@ -0,0 +1,140 @@
+"""
+This module contains the disk cache of downloaded article pages. Pages are stored compressed, one file per page,
+named after the hash of their canonical URL: the modification time of each file is the time the page was downloaded.
+Pages older than the time to live are downloaded again and, when the cache grows beyond its maximum size,
+the least recently downloaded pages are removed.
+"""
+import gzip
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from url_canonicaliser import canonicalise_url
+
+CACHE_EXTENSION = ".html.gz"
+TMP_EXTENSION = ".tmp"
+# Temporary files older than this number of seconds have been left by interrupted writes
+STALE_TMP_SECONDS = 3600
+
+
+def get_cache_key(link: str):
+    """
+    Return the key identifying the given page in the cache
+    :param link: Page URL
+    :return:
+    """
+    # The same page may be linked with e.g. different tracking parameters
+    return hashlib.sha256(canonicalise_url(link).encode('utf-8')).hexdigest()
+
+
+class PageCache:
+    """
+    Compressed pages stored on disk, with a time to live and a maximum size
+    """
+
+    def __init__(self, directory: str, ttl_seconds=None, max_bytes=None):
+        """
+        :param directory: directory where pages are stored
+        :param ttl_seconds: number of seconds after which a page is downloaded again. If None, pages never expire
+        :param max_bytes: maximum size of the cache. If None, pages are never evicted
+        """
+        if max_bytes is not None and max_bytes <= 0:
+            raise ValueError("The maximum size of the page cache must be positive, got {}".format(max_bytes))
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        # Pages may be stored by several scraping threads
+        self.lock = threading.Lock()
+        # Size of the stored pages, computed by evict and then updated by put, so that the directory is scanned
+        # only when the cache becomes too big
+        self.total_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        # Remove the temporary files left by previous runs
+        self.evict()
+
+    def get_filename(self, link: str):
+        """
+        Return the file where the page of the given link is stored
+        :param link: Page URL
+        :return:
+        """
+        return os.path.join(self.directory, get_cache_key(link) + CACHE_EXTENSION)
+
+    def get(self, link: str):
+        """
+        Return the stored page of the given link
+        :param link: Page URL
+        :return: content of the page, or None if it isn't stored or it is expired
+        """
+        filename = self.get_filename(link)
+        try:
+            if self.ttl_seconds is not None and time.time() - os.path.getmtime(filename) > self.ttl_seconds:
+                return None
+            with gzip.open(filename, 'rb') as f:
+                return f.read()
+        except (OSError, EOFError):
+            # Not stored, evicted in the meantime or corrupted
+            return None
+
+    def put(self, link: str, content: bytes):
+        """
+        Store the page of the given link, evicting the oldest pages if the cache becomes too big.
+        Pages that can't be stored (e.g. the disk is full) are skipped, since they can be downloaded again
+        :param link: Page URL
+        :param content: content of the page
+        :return:
+        """
+        # The file is written under a temporary name and then renamed, so that readers never see partial pages
+        tmp_filename = None
+        filename = self.get_filename(link)
+        try:
+            compressed_content = gzip.compress(content)
+            fd, tmp_filename = tempfile.mkstemp(dir=self.directory, suffix=TMP_EXTENSION)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(compressed_content)
+            with self.lock:
+                # The page may replace an expired one
+                replaced_bytes = os.path.getsize(filename) if os.path.exists(filename) else 0
+                os.replace(tmp_filename, filename)
+                self.total_bytes += len(compressed_content) - replaced_bytes
+        except OSError as ex:
+            logging.warning("Unable to store {} in the page cache".format(link))
+            logging.warning(ex)
+            if tmp_filename is not None and os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+            return
+        if self.max_bytes is not None and self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently downloaded pages until the cache size is lower than max_bytes, along with
+        stale temporary files
+        :return:
+        """
+        with self.lock:
+            pages = []
+            now = time.time()
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(CACHE_EXTENSION):
+                    stat = entry.stat()
+                    pages.append((stat.st_mtime, stat.st_size, entry.path))
+                elif entry.name.endswith(TMP_EXTENSION):
+                    try:
+                        if now - entry.stat().st_mtime > STALE_TMP_SECONDS:
+                            os.remove(entry.path)
+                    except OSError as ex:
+                        logging.warning(ex)
+            total_bytes = sum(size for _, size, _ in pages)
+            if self.max_bytes is not None:
+                for _, size, path in sorted(pages):
+                    if total_bytes <= self.max_bytes:
+                        break
+                    try:
+                        os.remove(path)
+                    except OSError as ex:
+                        logging.warning(ex)
+                    total_bytes -= size
+            self.total_bytes = total_bytes
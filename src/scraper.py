@@ -1,7 +1,23 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import zip_longest
+from urllib.parse import urlparse
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup, SoupStrainer
 import logging
 import re
+import threading
+import time
+
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_3) AppleWebKit/537.36 (KHTML, like Gecko) ' \
+             'Chrome/35.0.1916.47 Safari/537.36 '
+
+# One session for each host, so that connections are kept alive and reused among its articles
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+# Size of the blocks in which pages are downloaded
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
 
 
 def is_article_a_multimedia_page(link: str):
@@ -19,36 +35,162 @@ def is_article_a_multimedia_page(link: str):
         return False
 
 
-def scrape_page(link: str, article_class: str, first_paragraph_index: int, last_paragraph_index: int):
+def get_host(link: str):
+    """
+    Return the host of the given link
+    :param link: URL address
+    :return:
+    """
+    return urlparse(link).netloc.lower()
+
+
+def get_session(host: str, pool_size=2):
+    """
+    Return the session used for downloading pages of the given host, creating it if needed
+    :param host: host of the pages to download
+    :param pool_size: maximum number of connections kept alive with the host
+    :return:
+    """
+    with _SESSIONS_LOCK:
+        if host not in _SESSIONS:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _SESSIONS[host] = session
+        return _SESSIONS[host]
+
+
+def download_page(link: str, session=None, max_bytes=None, timeout=3):
+    """
+    Download the given page, aborting the download if it is bigger than max_bytes
+    :param link: Page URL
+    :param session: requests session to use for downloading the page. If None, a new connection is opened
+    :param max_bytes: maximum size of the page. If None, pages are always downloaded entirely
+    :param timeout: maximum number of seconds to wait for the server
+    :return: content of the page, or None if it is too big
+    """
+    headers = {'User-Agent': USER_AGENT}
+    with (session or requests).get(link, timeout=timeout, headers=headers, stream=True) as page:
+        # The server is unavailable or is blocking us: there is no article to parse
+        if page.status_code == 429 or page.status_code >= 500:
+            page.raise_for_status()
+        content_length = page.headers.get('Content-Length')
+        if max_bytes is not None and content_length and content_length.isdigit() and int(content_length) > max_bytes:
+            logging.warning("{} is bigger than {} bytes, skipping it".format(link, max_bytes))
+            return None
+        content = bytearray()
+        for chunk in page.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+            content.extend(chunk)
+            if max_bytes is not None and len(content) > max_bytes:
+                logging.warning("{} is bigger than {} bytes, skipping it".format(link, max_bytes))
+                return None
+    return bytes(content)
+
+
+def download_page_tracking_health(link: str, session, max_bytes, health):
+    """
+    Download the given page, unless its host is unavailable, with a timeout depending on the host latency.
+    The outcome of the download is recorded in the host health. Pages too big are neither a success nor a failure:
+    the host answered, but the download was aborted, so its latency isn't meaningful
+    :param link: Page URL
+    :param session: requests session to use for downloading the page. If None, a new connection is opened
+    :param max_bytes: maximum size of the page. If None, pages are always downloaded entirely
+    :param health: HostHealthTracker of all the hosts
+    :return: content of the page, or None if it is too big or its host is unavailable
+    """
+    host = get_host(link)
+    if not health.is_available(host):
+        logging.warning("Skipping {}: {} is unavailable".format(link, host))
+        return None
+    outcome_recorded = False
+    try:
+        start = time.monotonic()
+        content = download_page(link, session, max_bytes, health.get_timeout(host))
+        if content is not None:
+            health.record_success(host, time.monotonic() - start)
+            outcome_recorded = True
+        return content
+    except Exception:
+        health.record_failure(host)
+        outcome_recorded = True
+        raise
+    finally:
+        # Otherwise a host whose circuit is half open would never be requested again
+        if not outcome_recorded:
+            health.end_trial(host)
+
+
+def get_article_paragraphs(content: bytes, article_class: str, link: str, parser='html.parser'):
+    """
+    Return the paragraphs of the article in the given page
+    :param content: HTML page
+    :param article_class: CSS Class of the dive that contains all the article paragraphs
+    :param link: Article URL, used for logging
+    :param parser: parser used by BeautifulSoup, e.g. html.parser or lxml (faster)
+    :return:
+    """
+    # Only the elements where the article text can be are parsed: the div containing the article or,
+    # as a fallback, paragraphs and divs with the same class. Elements having any of its classes are kept,
+    # so that the searches below match the same elements they would match in the whole page
+    article_classes = set(article_class.split()) | {article_class}
+    only_article_elements = SoupStrainer(["div", "p"],
+                                         class_=lambda value: value is not None and
+                                         not article_classes.isdisjoint(value.split()))
+    soup = BeautifulSoup(content, parser, parse_only=only_article_elements)
+    article_content = soup.find("div", class_=article_class)
+    try:
+        paragraphs = article_content.find_all('p')
+    except AttributeError:
+        logging.warning("Can't find article text for {}, trying fallback strategies".format(link))
+        paragraphs = soup.find_all('p', {"class": article_class})
+    # If there is no paragraph the article text is on several div class
+    if not paragraphs:
+        paragraphs = soup.find_all("div", class_=article_class)
+    return paragraphs
+
+
+def scrape_page(link: str,
+                article_class: str,
+                first_paragraph_index: int,
+                last_paragraph_index: int,
+                session=None,
+                parser='html.parser',
+                max_bytes=None,
+                cache=None,
+                health=None):
     """
     Return the entire article in the given link
     :param link: Article URL
     :param article_class: CSS Class of the dive that contains all the article paragraphs
     :param first_paragraph_index: how many paragraphs should be skipped, starting from the beginning of the article
     :param last_paragraph_index: how many paragraphs should be skipped, starting from the end of the article
+    :param session: requests session to use for downloading the page. If None, a new connection is opened
+    :param parser: parser used by BeautifulSoup, e.g. html.parser or lxml (faster)
+    :param max_bytes: pages bigger than max_bytes are skipped. If None, pages are always downloaded entirely
+    :param cache: PageCache where pages are looked up before downloading them. If None, pages are always downloaded
+    :param health: HostHealthTracker used for skipping unavailable hosts and choosing timeouts. If None, a fixed
+    timeout of 3 seconds is used
     :return:
     """
     logging.info("scrape_page >>>")
     try:
         logging.info(link)
-        user_agent = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_3) AppleWebKit/537.36 (KHTML, like Gecko) ' \
-                     'Chrome/35.0.1916.47 Safari/537.36 '
-        headers = {'User-Agent': user_agent}
         article = []
         if is_article_a_multimedia_page(link):
             return article
-        page = requests.get(link, timeout=3, headers=headers)
-        soup = BeautifulSoup(page.content, 'html.parser')
-        article_content = soup.find("div", class_=article_class)
-        article = []
-        try:
-            paragraphs = article_content.find_all('p')
-        except AttributeError as ae:
-            logging.warning("Can't find article text for {}, trying fallback strategies".format(link))
-            paragraphs = soup.find_all('p', {"class": article_class})
-        # If there is no paragraph the article text is on several div class
-        if not paragraphs:
-            paragraphs = soup.find_all("div", class_=article_class)
+        content = cache.get(link) if cache else None
+        is_cached = content is not None
+        if not is_cached and health is None:
+            content = download_page(link, session, max_bytes)
+        elif not is_cached:
+            content = download_page_tracking_health(link, session, max_bytes, health)
+        if content is None:
+            return article
+        paragraphs = get_article_paragraphs(content, article_class, link, parser)
+        # Only pages containing an article are stored, so that error pages are downloaded again
+        if cache and not is_cached and paragraphs:
+            cache.put(link, content)
         # Remove, if needed, some of the first and last paragraph(s)
         if first_paragraph_index > 0:
             paragraphs = paragraphs[first_paragraph_index:]
@@ -65,3 +207,61 @@ def scrape_page(link: str, article_class: str, first_paragraph_index: int, last_
         logging.error("Error while parsing article {}".format(link))
         logging.error(e)
     return article
+
+
+def scrape_pages(articles: list,
+                 website_infos: dict,
+                 max_workers=8,
+                 max_workers_per_host=2,
+                 parser='html.parser',
+                 max_bytes=None,
+                 cache=None,
+                 health=None):
+    """
+    Download the given articles concurrently, yielding each one as soon as it is available. Connections to the same
+    host are kept alive and reused, and at most max_workers_per_host pages of the same host are downloaded at once
+    :param articles: articles to download, as returned by feed.get_feeds_articles
+    :param website_infos: Dictionaries where websites infos such as main_class are stored
+    :param max_workers: maximum number of pages downloaded at the same time
+    :param max_workers_per_host: maximum number of pages of the same host downloaded at the same time
+    :param parser: parser used by BeautifulSoup, e.g. html.parser or lxml (faster)
+    :param max_bytes: pages bigger than max_bytes are skipped. If None, pages are always downloaded entirely
+    :param cache: PageCache where pages are looked up before downloading them. If None, pages are always downloaded
+    :param health: HostHealthTracker used for skipping unavailable hosts and choosing timeouts
+    :return: generator of (article, text) pairs, in order of completion. Text is empty if it couldn't be scraped
+    """
+    logging.info("scrape_pages >>>")
+    articles_by_host = {}
+    for article in articles:
+        articles_by_host.setdefault(get_host(article['url']), []).append(article)
+    host_semaphores = {host: threading.BoundedSemaphore(max(1, max_workers_per_host)) for host in articles_by_host}
+
+    def scrape_article(article):
+        host = get_host(article['url'])
+        source_infos = website_infos[article['source']]
+        with host_semaphores[host]:
+            return scrape_page(article['url'],
+                               source_infos['main_class'],
+                               source_infos['number_of_first_paragraphs_to_ignore'],
+                               source_infos['number_of_last_paragraphs_to_ignore'],
+                               get_session(host, max_workers_per_host),
+                               parser,
+                               max_bytes,
+                               cache,
+                               health)
+
+    # Articles of different hosts are interleaved, so that workers don't wait for the same host
+    interleaved_articles = [article for host_articles in zip_longest(*articles_by_host.values())
+                            for article in host_articles if article is not None]
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {executor.submit(scrape_article, article): article for article in interleaved_articles}
+        for future in as_completed(futures):
+            article = futures[future]
+            try:
+                text = future.result()
+            except Exception as ex:
+                logging.error("Error while scraping article {}".format(article['url']))
+                logging.error(ex)
+                text = []
+            yield article, text
+    logging.info("scrape_pages <<<")
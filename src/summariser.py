@@ -2,7 +2,10 @@
 In this file all functions needed for creating summaries are present, from loading pretrained
 models to executing the core summarisation task.
 """
+import functools
 import math
+import multiprocessing
+import threading
 from typing import List
 import logging
 import numpy as np
@@ -10,10 +13,24 @@ import nltk
 from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
 from nltk.stem import WordNetLemmatizer
-from scipy.spatial.distance import cosine
-from sklearn.feature_extraction.text import TfidfVectorizer
-import networkx as nx
-from transformers_summaries import generate_transformers_summary
+from scipy.spatial.distance import cdist, cosine
+from scipy.sparse import csr_matrix, diags, issparse
+from sklearn.feature_extraction.text import TfidfTransformer
+from sklearn.preprocessing import normalize
+from sklearn.utils import murmurhash3_32
+from transformers_summaries import generate_transformers_summary, generate_transformers_summaries, \
+    get_max_input_tokens, split_sentences_into_chunks
+
+# Text preprocessor shared by all summaries created by the current process, see get_preprocessor
+_PREPROCESSOR = None
+# Vocabulary shared by algorithms that don't use a Word Embedding model, see get_vocabulary
+_VOCABULARY = None
+_VOCABULARY_LOCK = threading.Lock()
+# Maximum number of words kept by a vocabulary between two summaries, see get_vocabulary
+MAX_VOCABULARY_WORDS = 100000
+# Pool of processes computing WMD, created when first needed and reused by the following articles, see get_wmd_pool
+_WMD_POOL = None
+_WMD_POOL_LOCK = threading.Lock()
 
 
 def download_dependencies():
@@ -133,6 +150,197 @@ def preprocess_text(s: str, stopws, lemmatiser):
     return s
 
 
+class TextPreprocessor:
+    """
+    Preprocess text exactly as preprocess_text does, but it is meant to be built once per process: stop words
+    are kept in a set and lemmas are cached, so WordNet is queried only once for each distinct word
+    """
+
+    def __init__(self, stopws=None, lemmatiser=None, lemma_cache_size=100000):
+        """
+        :param stopws: stop words to remove (default: the ones returned by load_stop_words)
+        :param lemmatiser: lemmatiser instance to use (default: the one returned by initialise_lemmatiser)
+        :param lemma_cache_size: maximum number of lemmas kept in memory
+        """
+        self.stopws = frozenset(load_stop_words() if stopws is None else stopws)
+        self.lemmatiser = initialise_lemmatiser() if lemmatiser is None else lemmatiser
+        self.get_word_lemma = functools.lru_cache(maxsize=lemma_cache_size)(self.lemmatiser.lemmatize)
+
+    def preprocess_text(self, s: str):
+        """
+        Lowercase, tokenise and lemmatise the given text, removing stop words and special chars
+        :param s: text to preprocess
+        :return:
+        """
+        s = s.lower()
+        # Remove tabs, trailing spaces etc.
+        s = " ".join(s.split())
+        return [self.get_word_lemma(word) for word in word_tokenize(s)
+                if word.isalpha() and word not in self.stopws]
+
+    def preprocess_sentences(self, sentences: List[str]):
+        """
+        Preprocess all the given sentences
+        :param sentences: list of sentences
+        :return: list with the preprocessed words of each sentence
+        """
+        logging.debug("preprocess_sentences >>>")
+        preprocessed_sentences = [self.preprocess_text(s) for s in sentences]
+        logging.debug("preprocess_sentences <<<")
+        return preprocessed_sentences
+
+
+def get_preprocessor():
+    """
+    Return the text preprocessor of the current process, creating it if needed
+    :return:
+    """
+    global _PREPROCESSOR
+    if _PREPROCESSOR is None:
+        _PREPROCESSOR = TextPreprocessor()
+    return _PREPROCESSOR
+
+
+def grow_array(array: np.ndarray):
+    """
+    Return a copy of the given array with twice as many rows, the new ones being filled with zeros
+    :param array: array to grow
+    :return:
+    """
+    grown_array = np.zeros((2 * len(array),) + array.shape[1:], dtype=array.dtype)
+    grown_array[:len(array)] = array
+    return grown_array
+
+
+class Vocabulary:
+    """
+    Shared mapping between words and integer ids, so that each article is tokenised and looked up only once.
+    The first time a word is seen its vector is looked up in the Word Embedding model (if any) and stored in a matrix:
+    sentences encoded as arrays of ids are then vectorised by indexing it
+    """
+
+    def __init__(self, model=None):
+        """
+        :param model: word embedding model (mapping from words to vectors), if needed
+        """
+        self.model = model
+        # Summaries may be created by several threads, e.g. the ones of the endpoint
+        self.lock = threading.Lock()
+        self.word_ids = {}
+        self.words = []
+        # Arrays indexed by word id, grown when needed
+        self.in_model = np.zeros(1024, dtype=bool)
+        self.is_tf_idf_token = np.zeros(1024, dtype=bool)
+        self.hashes = np.zeros(1024, dtype=np.int64)
+        self.vectors = None
+        if model is not None:
+            self.vectors = np.zeros((1024, len(model['the'])), dtype=np.float32)
+
+    def __getstate__(self):
+        # Locks can't be sent to other processes, e.g. the WMD ones
+        state = dict(self.__dict__)
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def add_word(self, word: str):
+        """
+        Assign an id to the given word, looking up its vector
+        :param word: word to add
+        :return: word id
+        """
+        with self.lock:
+            # The word may have been added by another thread in the meantime
+            if word in self.word_ids:
+                return self.word_ids[word]
+            word_id = len(self.words)
+            if word_id == len(self.in_model):
+                self.in_model = grow_array(self.in_model)
+                self.is_tf_idf_token = grow_array(self.is_tf_idf_token)
+                self.hashes = grow_array(self.hashes)
+                if self.vectors is not None:
+                    self.vectors = grow_array(self.vectors)
+            self.words.append(word)
+            self.in_model[word_id] = False
+            # Same words kept by TfidfVectorizer default token pattern, i.e. at least two chars long
+            self.is_tf_idf_token[word_id] = len(word) > 1
+            self.hashes[word_id] = murmurhash3_32(word, positive=True)
+            if self.model is not None:
+                try:
+                    self.vectors[word_id] = self.model[word]
+                    self.in_model[word_id] = True
+                except KeyError:
+                    logging.warning("Word %s not found in WE model", word)
+            # The id is visible to encode only once the word is complete
+            self.word_ids[word] = word_id
+            return word_id
+
+    def encode(self, sentence: List[str]):
+        """
+        Transform the given words into an array of ids
+        :param sentence: list of words
+        :return:
+        """
+        ids = np.empty(len(sentence), dtype=np.int32)
+        for i, word in enumerate(sentence):
+            word_id = self.word_ids.get(word)
+            ids[i] = self.add_word(word) if word_id is None else word_id
+        return ids
+
+    def encode_sentences(self, sentences):
+        """
+        Transform the given sentences into arrays of ids. Sentences already encoded are returned as they are
+        :param sentences: list of sentences, each one being a list of words or an array of ids
+        :return:
+        """
+        return [s if isinstance(s, np.ndarray) else self.encode(s) for s in sentences]
+
+    def get_counts_matrix(self, sentences_ids, tf_idf_tokens_only=False, n_features=None):
+        """
+        Return the sparse matrix with the number of occurrences of each word (column) in each sentence (row)
+        :param sentences_ids: list of arrays of ids
+        :param tf_idf_tokens_only: whether to count only the words TfidfVectorizer would keep
+        :param n_features: if specified, words are hashed into n_features columns instead of using their ids
+        :return:
+        """
+        rows = np.repeat(np.arange(len(sentences_ids)), [len(ids) for ids in sentences_ids])
+        columns = np.concatenate(sentences_ids) if sentences_ids else np.zeros(0, dtype=np.int32)
+        if tf_idf_tokens_only:
+            mask = self.is_tf_idf_token[columns]
+            rows = rows[mask]
+            columns = columns[mask]
+        if n_features is not None:
+            columns = self.hashes[columns] % n_features
+        counts = csr_matrix((np.ones(len(columns)), (rows, columns)),
+                            shape=(len(sentences_ids), n_features or len(self.words)))
+        counts.sum_duplicates()
+        return counts
+
+
+def get_vocabulary(model_infos, max_words=None):
+    """
+    Return the vocabulary associated with the given model, creating it if needed. Algorithms that don't use a
+    Word Embedding model share the same vocabulary
+    :param model_infos: dict where word embedding model is specified, or None
+    :param max_words: if specified, a vocabulary with more words is replaced by an empty one. Texts being summarised
+    by other threads must keep using the previous one, see create_summary
+    :return:
+    """
+    global _VOCABULARY
+    with _VOCABULARY_LOCK:
+        if model_infos is None or 'model_object' not in model_infos:
+            if _VOCABULARY is None or (max_words is not None and len(_VOCABULARY.words) > max_words):
+                _VOCABULARY = Vocabulary()
+            return _VOCABULARY
+        if 'vocabulary' not in model_infos or \
+                (max_words is not None and len(model_infos['vocabulary'].words) > max_words):
+            model_infos['vocabulary'] = Vocabulary(model_infos['model_object'].model)
+        return model_infos['vocabulary']
+
+
 def vectorize_sentence(sentence: List[str], model, empty_strategy):
     """
     Given a text transform it in a list of vectors using Word Embeddings techniques
@@ -185,45 +393,369 @@ def compute_sentence_similarity(s1: List[str], s2: List[str], model_infos: dict)
     return score
 
 
-def build_similarity_matrix(sentences: List[str], model):
+def get_sentence_vectors(sentences_ids, model_infos: dict):
+    """
+    Vectorise all the given sentences at once by averaging the vectors of their words, as vectorize_sentence does
+    :param sentences_ids: list of sentences encoded as arrays of word ids
+    :param model_infos: dict where vocabulary and empty strategy to use are specified
+    :return: matrix with one sentence vector per row
+    """
+    vocabulary = get_vocabulary(model_infos)
+    if model_infos['empty_strategy'] != "fill":
+        # Words not in the embedding model are skipped instead of being replaced by a vector of zeros
+        sentences_ids = [ids[vocabulary.in_model[ids]] for ids in sentences_ids]
+    counts = vocabulary.get_counts_matrix(sentences_ids)
+    # Keep only the words of the current sentences
+    words = np.unique(counts.indices)
+    lengths = np.array([max(len(ids), 1) for ids in sentences_ids])
+    return (counts[:, words] @ vocabulary.vectors[words].astype(np.float64)) / lengths[:, np.newaxis]
+
+
+def normalise_vectors(vectors):
+    """
+    Divide each vector by its norm: vectors of zeros become vectors of nan
+    :param vectors: matrix with one vector per row
+    :return:
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return vectors / np.linalg.norm(vectors, axis=1)[:, np.newaxis]
+
+
+def build_cosine_similarity_matrix(sentences_ids, model_infos: dict):
+    """
+    Compute the cosine distance among all input sentences. Each sentence is vectorised only once and
+    all the distances are obtained through a single product of the normalised sentence vectors
+    :param sentences_ids: list of sentences encoded as arrays of word ids
+    :param model_infos: dict where vocabulary and empty strategy to use are specified
+    :return:
+    """
+    logging.info("build_cosine_similarity_matrix >>>")
+    n_sent = len(sentences_ids)
+    if n_sent == 0:
+        return np.zeros((0, 0))
+    # Sentences represented by a vector of zeros have an undefined (nan) distance, as in scipy's cosine
+    normalised_vectors = normalise_vectors(get_sentence_vectors(sentences_ids, model_infos))
+    matrix = 1.0 - normalised_vectors @ normalised_vectors.T
+    # Remove rounding errors, keeping the same range of scipy's cosine distance
+    matrix = np.clip(matrix, 0.0, 2.0)
+    np.fill_diagonal(matrix, 0)
+    logging.info("build_cosine_similarity_matrix <<<")
+    return matrix
+
+
+def select_central_sentences(normalised_vectors, max_sentences: int):
+    """
+    Cheap pre-filter for very long articles: keep the sentences closest to the article centroid
+    :param normalised_vectors: normalised sentence vectors (nan for sentences without vector)
+    :param max_sentences: number of sentences to keep
+    :return: indexes of the kept sentences, in ascending order
+    """
+    valid = ~np.isnan(normalised_vectors).any(axis=1)
+    centroid = np.mean(normalised_vectors[valid], axis=0) if valid.any() else np.zeros(normalised_vectors.shape[1])
+    closeness = np.where(valid, np.nan_to_num(normalised_vectors) @ centroid, -np.inf)
+    if max_sentences >= len(closeness):
+        return np.arange(len(closeness))
+    return np.sort(np.argpartition(-closeness, max_sentences - 1)[:max_sentences])
+
+
+def build_knn_similarity_matrix(sentences_ids, model_infos: dict, n_neighbours: int, max_sentences: int,
+                                block_size=256):
+    """
+    Build a sparse graph of the input sentences, keeping for each sentence only its n_neighbours strongest edges,
+    i.e. the ones with the highest cosine distance as in the dense matrix. Distances are computed by blocks of rows,
+    so memory is linear in the number of sentences. If there are more than max_sentences sentences, only the ones
+    closest to the article centroid are kept
+    :param sentences_ids: list of sentences encoded as arrays of word ids
+    :param model_infos: dict where vocabulary and empty strategy to use are specified
+    :param n_neighbours: number of edges kept for each sentence
+    :param max_sentences: maximum number of sentences in the graph
+    :param block_size: number of rows whose distances are computed at the same time
+    :return: sparse (symmetric) matrix and indexes of the sentences it refers to
+    """
+    logging.info("build_knn_similarity_matrix >>>")
+    normalised_vectors = normalise_vectors(get_sentence_vectors(sentences_ids, model_infos))
+    kept_sentences = select_central_sentences(normalised_vectors, max_sentences)
+    # Sentences without vector have no edges
+    normalised_vectors = np.nan_to_num(normalised_vectors[kept_sentences])
+    n_sent = len(kept_sentences)
+    n_neighbours = min(n_neighbours, n_sent - 1)
+    rows = []
+    columns = []
+    weights = []
+    if n_neighbours > 0:
+        for start in range(0, n_sent, block_size):
+            block = np.clip(1.0 - normalised_vectors[start:start + block_size] @ normalised_vectors.T, 0.0, 2.0)
+            block_rows = np.arange(start, start + len(block))
+            block[block_rows - start, block_rows] = -np.inf
+            neighbours = np.argpartition(-block, n_neighbours - 1, axis=1)[:, :n_neighbours]
+            rows.append(np.repeat(block_rows, n_neighbours))
+            columns.append(neighbours.ravel())
+            weights.append(block[np.repeat(block_rows - start, n_neighbours), neighbours.ravel()])
+    rows = np.concatenate(rows) if rows else np.zeros(0, dtype=int)
+    columns = np.concatenate(columns) if columns else np.zeros(0, dtype=int)
+    weights = np.concatenate(weights) if weights else np.zeros(0)
+    # Sentences without vector have zero distance: drop these edges
+    valid_edges = weights > 0
+    matrix = csr_matrix((weights[valid_edges], (rows[valid_edges], columns[valid_edges])), shape=(n_sent, n_sent))
+    # An edge is kept if it is among the strongest ones of at least one of its sentences
+    matrix = matrix.maximum(matrix.T).tocsr()
+    logging.info("build_knn_similarity_matrix <<<")
+    return matrix, kept_sentences
+
+
+def compute_wmd(ids_1, ids_2, vocabulary: Vocabulary):
+    """
+    Compute Word Mover's distance between two sentences encoded as arrays of word ids, following
+    word_mover_distance implementation: words not in the embedding model are ignored and inf is returned
+    if a sentence has no words left or all word distances are zero
+    :param ids_1: first sentence
+    :param ids_2: second sentence
+    :param vocabulary: vocabulary used for encoding the sentences
+    :return:
+    """
+    # Imported here as it is needed only by WMD
+    from pyemd import emd
+    ids_1 = ids_1[vocabulary.in_model[ids_1]]
+    ids_2 = ids_2[vocabulary.in_model[ids_2]]
+    if len(ids_1) == 0 or len(ids_2) == 0:
+        return float('inf')
+    words, positions = np.unique(np.concatenate([ids_1, ids_2]), return_inverse=True)
+    distance_matrix = cdist(vocabulary.vectors[words], vocabulary.vectors[words])
+    # Normalised bag of words of each sentence
+    nbow_1 = np.bincount(positions[:len(ids_1)], minlength=len(words)) / len(ids_1)
+    nbow_2 = np.bincount(positions[len(ids_1):], minlength=len(words)) / len(ids_2)
+    if np.sum(distance_matrix[np.ix_(nbow_1 > 0, nbow_2 > 0)]) == 0:
+        return float('inf')
+    return emd(nbow_1, nbow_2, distance_matrix)
+
+
+def get_article_vocabulary(sentences_ids, vocabulary: Vocabulary):
+    """
+    Return a vocabulary made only of the words of the given sentences, along with the sentences encoded with it:
+    unlike the shared vocabulary, it can be cheaply sent to other processes
+    :param sentences_ids: list of sentences encoded as arrays of word ids
+    :param vocabulary: vocabulary used for encoding the sentences
+    :return:
+    """
+    all_ids = np.concatenate(sentences_ids) if sentences_ids else np.zeros(0, dtype=np.int32)
+    words, positions = np.unique(all_ids, return_inverse=True)
+    article_vocabulary = Vocabulary()
+    article_vocabulary.words = [vocabulary.words[word_id] for word_id in words]
+    article_vocabulary.word_ids = {word: word_id for word_id, word in enumerate(article_vocabulary.words)}
+    article_vocabulary.in_model = vocabulary.in_model[words]
+    article_vocabulary.is_tf_idf_token = vocabulary.is_tf_idf_token[words]
+    article_vocabulary.hashes = vocabulary.hashes[words]
+    article_vocabulary.vectors = vocabulary.vectors[words]
+    article_sentences_ids = np.split(positions.astype(np.int32), np.cumsum([len(ids) for ids in sentences_ids])[:-1])
+    return article_sentences_ids, article_vocabulary
+
+
+def get_wmd_pool(n_workers: int):
+    """
+    Return the pool of processes computing WMD, creating it if needed. Processes are not forked from the current one,
+    which may have other threads running (e.g. the scraping ones) holding locks the child processes would inherit
+    :param n_workers: number of processes
+    :return:
+    """
+    global _WMD_POOL
+    with _WMD_POOL_LOCK:
+        if _WMD_POOL is not None and _WMD_POOL[0] != n_workers:
+            _WMD_POOL[1].terminate()
+            _WMD_POOL = None
+        if _WMD_POOL is None:
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _WMD_POOL = (n_workers, multiprocessing.get_context(start_method).Pool(n_workers))
+        return _WMD_POOL[1]
+
+
+def compute_wmd_pairs(pairs, sentences_ids, vocabulary: Vocabulary):
+    """
+    Compute Word Mover's distance for the given pairs of sentences
+    :param pairs: list of (i, j) sentence indexes
+    :param sentences_ids: list of sentences encoded as arrays of word ids
+    :param vocabulary: vocabulary used for encoding the sentences
+    :return:
+    """
+    return [compute_wmd(sentences_ids[i], sentences_ids[j], vocabulary) for i, j in pairs]
+
+
+def compute_wmd_bounds(sentences_ids, pairs, vocabulary: Vocabulary):
+    """
+    Compute cheap lower and upper bounds of Word Mover's distance for the given pairs of sentences.
+    The lower bound is the highest among word centroid distance and relaxed WMD, where each word is moved to the
+    closest word of the other sentence. The upper bound is the cost of moving each word to all the words of the other
+    sentence proportionally to their frequency. Word distances are computed once for the whole article
+    :param sentences_ids: list of sentences encoded as arrays of word ids
+    :param pairs: list of (i, j) sentence indexes
+    :param vocabulary: vocabulary used for encoding the sentences
+    :return: arrays with lower and upper bounds of each pair: both are inf when WMD would be inf
+    """
+    logging.info("compute_wmd_bounds >>>")
+    # Out-of-vocabulary words are ignored, as in WMD
+    docs = [ids[vocabulary.in_model[ids]] for ids in sentences_ids]
+    n_sent = len(sentences_ids)
+    lower = np.full(len(pairs), np.inf)
+    upper = np.full(len(pairs), np.inf)
+    words = np.unique(np.concatenate(docs)) if docs else np.zeros(0, dtype=np.int32)
+    if len(words) == 0:
+        return lower, upper
+    word_vectors = vocabulary.vectors[words].astype(np.float64)
+    word_distances = cdist(word_vectors, word_vectors)
+    # Normalised bag of words of each sentence, using positions in the article words
+    words_positions = []
+    words_weights = []
+    centroids = np.zeros((n_sent, word_vectors.shape[1]))
+    for k, doc in enumerate(docs):
+        positions, counts = np.unique(np.searchsorted(words, doc), return_counts=True)
+        weights = counts / max(len(doc), 1)
+        words_positions.append(positions)
+        words_weights.append(weights)
+        if len(doc):
+            centroids[k] = weights @ word_vectors[positions]
+    centroid_distances = cdist(centroids, centroids)
+    for p, (i, j) in enumerate(pairs):
+        if len(words_positions[i]) == 0 or len(words_positions[j]) == 0:
+            continue
+        cost = word_distances[np.ix_(words_positions[i], words_positions[j])]
+        upper_bound = words_weights[i] @ cost @ words_weights[j]
+        # If all the distances are zero WMD is inf
+        if upper_bound == 0:
+            continue
+        relaxed_wmd = max(words_weights[i] @ cost.min(axis=1), words_weights[j] @ cost.min(axis=0))
+        lower[p] = max(relaxed_wmd, centroid_distances[i, j])
+        upper[p] = upper_bound
+    logging.info("compute_wmd_bounds <<<")
+    return lower, upper
+
+
+def build_wmd_similarity_matrix(sentences_ids, model_infos: dict):
+    """
+    Compute Word Mover's distance among all input sentences. Only the upper triangle of the matrix is computed:
+    if more workers are specified, pairs are split among a pool of processes receiving only the vectors of the
+    article words (see get_wmd_pool).
+    If a tolerance (wmd_tolerance) is specified, cheap WMD bounds are computed first: pairs whose upper bound exceeds
+    the lower one by at most tolerance * lower bound get the average of the two bounds, therefore with a relative
+    error of at most tolerance / 2. Exact WMD is computed only for the remaining pairs
+    :param sentences_ids: list of sentences encoded as arrays of word ids
+    :param model_infos: dict where vocabulary, number of workers (wmd_workers) and tolerance (wmd_tolerance)
+    are specified
+    :return:
+    """
+    logging.info("build_wmd_similarity_matrix >>>")
+    n_sent = len(sentences_ids)
+    matrix = np.zeros((n_sent, n_sent))
+    pairs = [(i, j) for i in range(0, n_sent) for j in range(i + 1, n_sent)]
+    vocabulary = get_vocabulary(model_infos)
+    tolerance = model_infos.get('wmd_tolerance')
+    if tolerance is not None:
+        lower, upper = compute_wmd_bounds(sentences_ids, pairs, vocabulary)
+        with np.errstate(invalid='ignore'):
+            settled = np.isinf(upper) | (upper - lower <= tolerance * lower)
+        for p in np.flatnonzero(settled):
+            i, j = pairs[p]
+            matrix[i, j] = matrix[j, i] = (lower[p] + upper[p]) / 2
+        pairs = [pairs[p] for p in np.flatnonzero(~settled)]
+        logging.info("%d WMD pairs settled by their bounds, %d to compute", np.sum(settled), len(pairs))
+    n_workers = model_infos.get('wmd_workers', 1) or 1
+    if n_workers > 1 and len(pairs) >= 2 * n_workers:
+        chunk_size = math.ceil(len(pairs) / (n_workers * 4))
+        article_sentences_ids, article_vocabulary = get_article_vocabulary(sentences_ids, vocabulary)
+        chunks = [(pairs[k:k + chunk_size], article_sentences_ids, article_vocabulary)
+                  for k in range(0, len(pairs), chunk_size)]
+        scores = [score for chunk_scores in get_wmd_pool(n_workers).starmap(compute_wmd_pairs, chunks)
+                  for score in chunk_scores]
+    else:
+        scores = compute_wmd_pairs(pairs, sentences_ids, vocabulary)
+    for (i, j), score in zip(pairs, scores):
+        matrix[i, j] = matrix[j, i] = score
+    logging.info("build_wmd_similarity_matrix <<<")
+    return matrix
+
+
+def build_similarity_matrix(sentences, model):
     """
     Compute the similarity matrix related to all input sentences
-    :param sentences: list of sentences to compare
+    :param sentences: list of sentences to compare, either as lists of words or as arrays of word ids
     :param model: word embedding model
     :return:
     """
     logging.info("build_similarity_matrix >>>")
-    n_sent = len(sentences)
-    matrix = np.zeros((n_sent, n_sent))
-    for i in range(0, n_sent):
-        for j in range(0, n_sent):
-            if i != j and matrix[i, j] == 0:
-                matrix[i, j] = matrix[j, i] = compute_sentence_similarity(sentences[i],
-                                                                          sentences[j],
-                                                                          model)
+    sentences_ids = get_vocabulary(model).encode_sentences(sentences)
+    distance_metric = model['distance_metric']
+    if distance_metric == "cosine":
+        matrix = build_cosine_similarity_matrix(sentences_ids, model)
+    elif distance_metric == "wmd":
+        matrix = build_wmd_similarity_matrix(sentences_ids, model)
+    else:
+        raise NameError("Invalid distance metric: it should be cosine or wmd")
     logging.info("build_similarity_matrix <<<")
     return matrix
 
 
+def compute_pagerank(matrix, alpha=0.85, tol=1.0e-6, max_iter=100, nstart=None):
+    """
+    Compute the PageRank of the nodes of the weighted graph described by the given adjacency matrix, with the same
+    power iteration of networkx.pagerank: nodes without edges are linked to all nodes and the iteration stops when
+    the l1 variation of the scores is lower than n_nodes * tol
+    :param matrix: dense or sparse (scipy) adjacency matrix
+    :param alpha: damping parameter
+    :param tol: tolerance parameter for PageRank convergence
+    :param max_iter: maximum number of iteration for PageRank convergence
+    :param nstart: initial scores, e.g. the ones of a previous run. If None, uniform scores are used
+    :return: array with the score of each node
+    """
+    logging.debug("compute_pagerank >>>")
+    n_nodes = matrix.shape[0]
+    if n_nodes == 0:
+        return np.zeros(0)
+    if issparse(matrix):
+        matrix = csr_matrix(matrix, dtype=float)
+        out_weights = np.asarray(matrix.sum(axis=1)).ravel()
+    else:
+        matrix = np.asarray(matrix, dtype=float)
+        out_weights = matrix.sum(axis=1)
+    inverse_out_weights = np.zeros(n_nodes)
+    inverse_out_weights[out_weights != 0] = 1.0 / out_weights[out_weights != 0]
+    # Transposed transition matrix, so that each iteration is a single matrix-vector product
+    if issparse(matrix):
+        transition_t = (diags(inverse_out_weights) @ matrix).T.tocsr()
+    else:
+        transition_t = (matrix * inverse_out_weights[:, np.newaxis]).T
+    uniform = np.repeat(1.0 / n_nodes, n_nodes)
+    if nstart is None:
+        scores = uniform
+    else:
+        scores = np.asarray(nstart, dtype=float)
+        scores = scores / scores.sum()
+    is_dangling = out_weights == 0
+    for _ in range(max_iter):
+        last_scores = scores
+        scores = alpha * (transition_t @ scores + np.sum(scores[is_dangling]) * uniform) + (1 - alpha) * uniform
+        if np.abs(scores - last_scores).sum() < n_nodes * tol:
+            logging.debug("compute_pagerank <<<")
+            return scores
+    raise RuntimeError("PageRank failed to converge in {} iterations".format(max_iter))
+
+
 def pagerank_summarisation(matrix,
                            original_article: List[str],
                            settings: dict,
                            tol=0.01,
                            max_iter=200,
+                           nstart=None
                            ):
     """
     Return the n most dissimilar sentences in the matrix. The comparison is done using PageRank.
-    :param matrix: sentences similarity matrix
+    :param matrix: sentences similarity matrix, dense or sparse
     :param original_article: original phrases
     :param settings: Dictionary with summarisation settings to use
     :param tol: tolerance parameter for PageRank convergence
     :param max_iter: maximum number of iteration for PageRank convergence
+    :param nstart: initial PageRank scores (default uniform)
     :return:
     """
     logging.info("find_top_n_sentences >>>")
-    graph = nx.from_numpy_array(matrix)
-    scores_dict = nx.pagerank(graph, max_iter=max_iter, tol=tol)
-    scores = list(scores_dict.values())
+    scores = list(compute_pagerank(matrix, tol=tol, max_iter=max_iter, nstart=nstart))
     summary = get_sentences_by_scores(scores, original_article, True, settings)
     text = " ".join(summary)
     logging.info("find_top_n_sentences <<<")
@@ -260,50 +792,82 @@ def get_sentences_by_scores(scores, sentences: List[str], maximise_score: bool,
         else:
             summary_sentences_index = np.where(np.array(scores) <= threshold)[0]
     else:
-        # Create a dictionary for storing sentences and their position in the given text
-        sentences_with_index = {}
-        for i, sentence in enumerate(sentences):
-            sentences_with_index[sentence] = i
-        # Order sentences by their score
-        ranked_sentences = sorted(((scores[i], s) for i, s in enumerate(sentences)),
-                                  reverse=maximise_score)
-        # Keep only most meaningful sentences
-        ranked_sentences = ranked_sentences[0:n_sentences]
-        # Get the indexes of these meaningful sentences
-        summary_sentences_index = []
-        for ranked_sentence in ranked_sentences:
-            current_sentence = ranked_sentence[1]
-            current_sentence_index = sentences_with_index[current_sentence]
-            summary_sentences_index.append(current_sentence_index)
+        # Lower ranks are better: sentences without a valid score are the worst ones
+        ranks = -np.array(scores, dtype=float) if maximise_score else np.array(scores, dtype=float)
+        ranks[np.isnan(ranks)] = np.inf
+        # Partial selection of the most meaningful sentences, without sorting all of them
+        threshold = ranks[np.argpartition(ranks, n_sentences - 1)[:n_sentences]].max()
+        # Sentences having the same score of the last selected one are picked following their order in the text
+        best_sentences_index = np.flatnonzero(ranks < threshold)
+        tied_sentences_index = np.flatnonzero(ranks == threshold)[:n_sentences - len(best_sentences_index)]
         # Sort indexes in ascending order: in this way we will maintain article coherence
-        summary_sentences_index.sort()
+        summary_sentences_index = np.sort(np.concatenate([best_sentences_index, tied_sentences_index]))
     summary = [sentences[i] for i in summary_sentences_index]
     logging.info("get_sentences_by_scores <<<")
     return summary
 
 
-def tf_idf_summarisation(preprocessed_sentences: List[str],
+def get_corpus_tf_idf_matrix(sentences_ids, vocabulary: Vocabulary, document_frequencies, update_document_frequencies):
+    """
+    Compute the tf-idf matrix of the given sentences using the document frequencies of the whole corpus, so that no
+    vocabulary has to be built. Values are normalised as TfidfTransformer does
+    :param sentences_ids: previously pre-processed sentences, encoded as arrays of word ids
+    :param vocabulary: vocabulary used for encoding the sentences
+    :param document_frequencies: DocumentFrequencyStore with the statistics of previous articles
+    :param update_document_frequencies: whether to add the current article to the statistics
+    :return:
+    """
+    counts = vocabulary.get_counts_matrix(sentences_ids,
+                                          tf_idf_tokens_only=True,
+                                          n_features=document_frequencies.n_features)
+    # Keep only the (hashed) words of the current article
+    buckets = np.unique(counts.indices)
+    if len(buckets) == 0:
+        raise ValueError("empty vocabulary; perhaps the documents only contain stop words")
+    if update_document_frequencies:
+        document_frequencies.add_document(buckets)
+    counts = counts[:, buckets]
+    return normalize(csr_matrix(counts.multiply(document_frequencies.get_idf(buckets))))
+
+
+def tf_idf_summarisation(sentences_ids,
                          original_article: List[str],
-                         settings: dict):
+                         settings: dict,
+                         vocabulary: Vocabulary,
+                         document_frequencies=None,
+                         update_document_frequencies=False):
     """
     Create a summary according to tf-idf values in the given text
-    :param preprocessed_sentences: previously pre-processed sentences
+    :param sentences_ids: previously pre-processed sentences, encoded as arrays of word ids
     :param original_article: sentences to evaluate for summarisation in their original form
     :param settings: Dictionary with summarisation settings to use
+    :param vocabulary: vocabulary used for encoding the sentences
+    :param document_frequencies: DocumentFrequencyStore used for computing IDF on all the summarised articles.
+    If None, IDF is computed on the sentences of the current article
+    :param update_document_frequencies: whether to add the current article to the document frequencies
     :return:
     """
     logging.info("tf_idf_summarisation >>>")
-    vectorizer = TfidfVectorizer()
-    tfidf_matrix = vectorizer.fit_transform(preprocessed_sentences)
-    number_of_sentences = tfidf_matrix.shape[0]
-    scores = []
-    for index in range(0, number_of_sentences):
-        tf_idf_score_curr_sent = tfidf_matrix[index].toarray()
-        # remove zero scores
-        tf_idf_score_curr_sent = tf_idf_score_curr_sent[tf_idf_score_curr_sent > 0]
-        # Compute the average tf-idf value in the given sentence
-        curr_sent_avg_score = np.mean(tf_idf_score_curr_sent)
-        scores.append(curr_sent_avg_score)
+    if document_frequencies is None:
+        counts = vocabulary.get_counts_matrix(sentences_ids, tf_idf_tokens_only=True)
+        # Keep only the words of the current article
+        counts = counts[:, np.unique(counts.indices)]
+        if counts.shape[1] == 0:
+            raise ValueError("empty vocabulary; perhaps the documents only contain stop words")
+        tfidf_matrix = TfidfTransformer().fit_transform(counts).tocsr()
+    else:
+        tfidf_matrix = get_corpus_tf_idf_matrix(sentences_ids,
+                                                vocabulary,
+                                                document_frequencies,
+                                                update_document_frequencies)
+    tfidf_matrix.eliminate_zeros()
+    # Average tf-idf value of the words in each sentence, i.e. row sums divided by the number of non zero values.
+    # Sentences without any word get a score of zero
+    scores_sum = np.asarray(tfidf_matrix.sum(axis=1)).ravel()
+    words_per_sentence = np.diff(tfidf_matrix.indptr)
+    scores = np.divide(scores_sum, words_per_sentence,
+                       out=np.zeros(len(scores_sum)),
+                       where=words_per_sentence > 0)
     summary = get_sentences_by_scores(scores, original_article, True, settings)
     # Transform the summary back into a string
     summary = " ".join(summary)
@@ -313,30 +877,48 @@ def tf_idf_summarisation(preprocessed_sentences: List[str],
 
 def create_summary(text: List[str],
                    model,
-                   settings: dict):
+                   settings: dict,
+                   update_document_frequencies=False):
     """
     Summarize the given text using n sentences.
     :param text: List of paragraphs containing the article's text
     :param model: Word Embeddings model
     :param settings: Dictionary with summarisation settings to use
+    :param update_document_frequencies: whether the text should be added to corpus statistics used by tf_idf, if any
     :return:
     """
     logging.info("create_summary >>>")
 
     sentences = split_text_into_sentences(text)
     sentences = filter_sentences_by_length(sentences, settings['min_words_in_sentence'])
-    stopws = load_stop_words()
-    lemmatiser = initialise_lemmatiser()
-    preprocessed_sentences = [preprocess_text(s, stopws, lemmatiser) for s in sentences]
-    # Ensure that preprocessed sentences is a list of strings, otherwise words will be glued together:
-    if any(isinstance(el, list) for el in preprocessed_sentences):
-        preprocessed_sentences = [" ".join(s) for s in preprocessed_sentences]
     algorithm = settings['algorithm']
-    if algorithm == "pagerank":
-        matrix = build_similarity_matrix(preprocessed_sentences, model)
+    if algorithm == "pagerank" or algorithm == "tf_idf":
+        # Each sentence is tokenised and its words looked up only once. The vocabulary is emptied when it grows
+        # too much, e.g. with names and typos of a long-running process
+        vocabulary = get_vocabulary(model, MAX_VOCABULARY_WORDS)
+        if isinstance(model, dict) and 'model_object' in model:
+            # The vocabulary may be emptied by another thread while this text is being summarised
+            model = dict(model, vocabulary=vocabulary)
+        sentences_ids = vocabulary.encode_sentences(get_preprocessor().preprocess_sentences(sentences))
+    if algorithm == "pagerank" and settings.get('graph_mode') == "knn" and \
+            len(sentences) > settings.get('knn_min_sentences', 100):
+        # Very long articles (e.g. live blogs, transcripts): use a sparse graph instead of the full matrix
+        matrix, kept_sentences = build_knn_similarity_matrix(sentences_ids,
+                                                             model,
+                                                             settings.get('knn_neighbours', 10),
+                                                             settings.get('max_sentences', 300))
+        summary = pagerank_summarisation(matrix, [sentences[i] for i in kept_sentences], settings)
+    elif algorithm == "pagerank":
+        matrix = build_similarity_matrix(sentences_ids, model)
         summary = pagerank_summarisation(matrix, sentences, settings)
     elif algorithm == "tf_idf":
-        summary = tf_idf_summarisation(preprocessed_sentences, sentences, settings)
+        document_frequencies = model.get('document_frequencies') if isinstance(model, dict) else None
+        summary = tf_idf_summarisation(sentences_ids,
+                                       sentences,
+                                       settings,
+                                       vocabulary,
+                                       document_frequencies,
+                                       update_document_frequencies)
     elif algorithm == "bart" or algorithm == "t5":
         summary = generate_transformers_summary(sentences, model)
     else:
@@ -344,3 +926,100 @@ def create_summary(text: List[str],
         summary = ""
     logging.info("create_summary <<<")
     return summary
+
+
+def create_chunked_transformers_summaries(articles_sentences: List[List[str]],
+                                          summarizer,
+                                          settings: dict,
+                                          max_passes=3):
+    """
+    Summarize articles longer than the input limit of a transformer model without truncating them.
+    Sentences are grouped into chunks of at most chunk_max_tokens tokens and all the chunks are summarised in batches
+    (map). The summaries of the chunks of each article are then combined according to chunk_reduce (reduce):
+    - abstractive: they are summarised again, repeating the procedure if they still don't fit a single chunk
+    - extractive: the most important sentences are selected with tf_idf
+    :param articles_sentences: list of articles, each one being a list of sentences
+    :param summarizer: transformers pipeline to use for summarising text
+    :param settings: Dictionary with summarisation settings to use
+    :param max_passes: maximum number of abstractive passes: after that, texts are truncated by the pipeline
+    :return: list of summaries, in the same order of articles. A summary is None if it couldn't be created
+    """
+    logging.info("create_chunked_transformers_summaries >>>")
+    batch_size = settings.get('transformers_batch_size', 8)
+    max_tokens = settings.get('chunk_max_tokens') or get_max_input_tokens(summarizer)
+    articles_chunks = [split_sentences_into_chunks(sentences, summarizer, max_tokens)
+                       for sentences in articles_sentences]
+    # Map: chunks of all the articles are summarised together
+    chunks = [[chunk] for article_chunks in articles_chunks for chunk in article_chunks]
+    chunks_summaries = generate_transformers_summaries(chunks, summarizer, batch_size)
+    summaries = []
+    articles_to_reduce = {}
+    start = 0
+    for i, article_chunks in enumerate(articles_chunks):
+        article_summaries = [summary for summary in chunks_summaries[start:start + len(article_chunks)] if summary]
+        start += len(article_chunks)
+        summaries.append(None)
+        if len(article_chunks) == 1 or len(article_summaries) <= 1:
+            summaries[i] = article_summaries[0] if article_summaries else None
+        elif settings['chunk_reduce'] == "extractive":
+            try:
+                summaries[i] = create_summary(article_summaries,
+                                              None,
+                                              dict(settings, algorithm="tf_idf", min_words_in_sentence=1))
+            except Exception as ex:
+                logging.error(ex)
+        else:
+            articles_to_reduce[i] = article_summaries
+    # Reduce: summaries of the chunks of the same article are summarised again
+    if articles_to_reduce:
+        if max_passes > 1:
+            reduced_summaries = create_chunked_transformers_summaries(list(articles_to_reduce.values()),
+                                                                      summarizer,
+                                                                      settings,
+                                                                      max_passes - 1)
+        else:
+            reduced_summaries = generate_transformers_summaries([[" ".join(article_summaries)] for
+                                                                 article_summaries in articles_to_reduce.values()],
+                                                                summarizer,
+                                                                batch_size)
+        for i, summary in zip(articles_to_reduce.keys(), reduced_summaries):
+            summaries[i] = summary
+    logging.info("create_chunked_transformers_summaries <<<")
+    return summaries
+
+
+def create_summaries(texts: List[List[str]],
+                     model,
+                     settings: dict,
+                     update_document_frequencies=False):
+    """
+    Summarize several articles. With bart and t5 articles are summarised in batches of transformers_batch_size,
+    which is much faster than summarising them one at a time
+    :param texts: list of articles, each one being a list of paragraphs
+    :param model: Word Embeddings model
+    :param settings: Dictionary with summarisation settings to use
+    :param update_document_frequencies: whether the texts should be added to corpus statistics used by tf_idf, if any
+    :return: list of summaries, in the same order of texts. A summary is None if it couldn't be created
+    """
+    logging.info("create_summaries >>>")
+    algorithm = settings['algorithm']
+    if algorithm == "bart" or algorithm == "t5":
+        articles_sentences = [filter_sentences_by_length(split_text_into_sentences(text),
+                                                         settings['min_words_in_sentence'])
+                              for text in texts]
+        if settings.get('chunk_reduce'):
+            summaries = create_chunked_transformers_summaries(articles_sentences, model, settings)
+        else:
+            summaries = generate_transformers_summaries(articles_sentences,
+                                                        model,
+                                                        settings.get('transformers_batch_size', 8))
+    else:
+        summaries = []
+        for text in texts:
+            try:
+                summaries.append(create_summary(text, model, settings, update_document_frequencies))
+            except Exception as ex:
+                logging.error(ex)
+                summaries.append(None)
+    logging.info("create_summaries <<<")
+    return summaries
@@ -0,0 +1,126 @@
+"""
+This module compares the default transformers pipeline with the CPU-optimised one (see
+transformers_summaries.CPUSummarizer) on a local corpus, reporting the latency of both and how much the optimised
+summaries differ from the default ones. The corpus is a text file with one article per block of lines, blocks being
+separated by empty lines.
+"""
+from collections import Counter
+import argparse
+import logging
+import time
+import numpy as np
+import transformers_summaries
+
+
+def load_corpus(corpus_fn: str):
+    """
+    Load the articles of the given corpus
+    :param corpus_fn: text file with one article per block of lines, separated by empty lines
+    :return: list of articles, each one being a list of lines
+    """
+    with open(corpus_fn, 'r', encoding='utf-8') as f:
+        blocks = f.read().split("\n\n")
+    return [[line.strip() + " " for line in block.split("\n") if line.strip()] for block in blocks if block.strip()]
+
+
+def compute_rouge_1(candidate: str, reference: str):
+    """
+    Return the ROUGE-1 F1 score, i.e. the unigram overlap, of the candidate text with respect to the reference one
+    :param candidate: text to evaluate
+    :param reference: reference text
+    :return:
+    """
+    candidate_counts = Counter(candidate.lower().split())
+    reference_counts = Counter(reference.lower().split())
+    overlap = sum((candidate_counts & reference_counts).values())
+    if overlap == 0:
+        return 0.0
+    precision = overlap / sum(candidate_counts.values())
+    recall = overlap / sum(reference_counts.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def time_summaries(texts, summarizer):
+    """
+    Summarise the given texts one at a time, measuring how long each summary takes
+    :param texts: list of articles, each one being a list of lines
+    :param summarizer: transformers pipeline to use for summarising texts
+    :return: summaries and their latencies in seconds
+    """
+    summaries = []
+    latencies = []
+    for text in texts:
+        start = time.perf_counter()
+        summaries.append(transformers_summaries.generate_transformers_summary(text, summarizer))
+        latencies.append(time.perf_counter() - start)
+    return summaries, latencies
+
+
+def benchmark_summarizer(texts, load_summarizer):
+    """
+    Load a summarizer and time the summaries of the given texts
+    :param texts: list of articles, each one being a list of lines
+    :param load_summarizer: function without arguments returning the summarizer to use
+    :return: summaries and their latencies in seconds
+    """
+    summarizer = load_summarizer()
+    # The first summary includes lazy initialisations: it isn't representative
+    time_summaries(texts[:1], summarizer)
+    return time_summaries(texts, summarizer)
+
+
+def compare_summarizers(texts, load_baseline_summarizer, load_optimised_summarizer):
+    """
+    Compare the latency and the quality of the summaries created by the two summarizers. The optimised summarizer
+    is loaded only after the baseline one has been timed, since the number of torch threads it sets applies to the
+    whole process
+    :param texts: list of articles, each one being a list of lines
+    :param load_baseline_summarizer: function returning the summarizer used as reference, i.e. the current
+    configuration
+    :param load_optimised_summarizer: function returning the summarizer to evaluate
+    :return: report with latencies, speed-up and ROUGE-1 scores
+    """
+    logging.info("compare_summarizers >>>")
+    baseline_summaries, baseline_latencies = benchmark_summarizer(texts, load_baseline_summarizer)
+    optimised_summaries, optimised_latencies = benchmark_summarizer(texts, load_optimised_summarizer)
+    articles = ["".join(text) for text in texts]
+    baseline_rouge = [compute_rouge_1(summary, article) for summary, article in zip(baseline_summaries, articles)]
+    optimised_rouge = [compute_rouge_1(summary, article) for summary, article in zip(optimised_summaries, articles)]
+    agreement = [compute_rouge_1(optimised, baseline) for optimised, baseline in
+                 zip(optimised_summaries, baseline_summaries)]
+    report = {"articles": len(texts),
+              "baseline_mean_latency": float(np.mean(baseline_latencies)),
+              "optimised_mean_latency": float(np.mean(optimised_latencies)),
+              "baseline_p95_latency": float(np.percentile(baseline_latencies, 95)),
+              "optimised_p95_latency": float(np.percentile(optimised_latencies, 95)),
+              "speed_up": float(np.sum(baseline_latencies) / np.sum(optimised_latencies)),
+              # Unigram overlap of the summaries with their articles, and its variation
+              "baseline_rouge_1": float(np.mean(baseline_rouge)),
+              "optimised_rouge_1": float(np.mean(optimised_rouge)),
+              "rouge_1_delta": float(np.mean(optimised_rouge) - np.mean(baseline_rouge)),
+              # How similar optimised summaries are to the baseline ones (1 means identical words)
+              "rouge_1_agreement": float(np.mean(agreement))}
+    logging.info("compare_summarizers <<<")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the latency and the summaries of the default transformers "
+                                                 "model with the CPU-optimised one")
+    parser.add_argument("corpus_fn", help="text file with one article per block of lines, separated by empty lines")
+    parser.add_argument("model_name", choices=["bart", "t5"])
+    parser.add_argument("--model_id", help="Hugging Face checkpoint or local directory")
+    parser.add_argument("--threads", type=int, help="number of threads used within each operation")
+    parser.add_argument("--interop_threads", type=int, help="number of threads used across operations")
+    args = parser.parse_args()
+    corpus = load_corpus(args.corpus_fn)
+    report = compare_summarizers(corpus,
+                                 lambda: transformers_summaries.load_transformer_model(args.model_name, args.model_id),
+                                 lambda: transformers_summaries.load_transformer_model(
+                                     args.model_name,
+                                     args.model_id,
+                                     cpu_mode=True,
+                                     threads=args.threads,
+                                     interop_threads=args.interop_threads))
+    for key, value in report.items():
+        print("{}: {}".format(key, value))
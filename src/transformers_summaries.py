@@ -1,19 +1,72 @@
 import logging
 
+# Checkpoints used when no model id is specified: the BART one is the default of the summarization pipeline
+DEFAULT_MODEL_IDS = {"bart": "sshleifer/distilbart-cnn-12-6",
+                     "t5": "t5-small"}
 
-def load_transformer_model(model_name: str):
+
+# Greedy decoding: a single hypothesis, without sampling, is the cheapest way of generating a summary
+GREEDY_GENERATION_KWARGS = {"num_beams": 1, "do_sample": False}
+
+
+class CPUSummarizer:
+    """
+    Wrapper of a transformers pipeline optimised for CPU-only machines: the linear layers of the model can be
+    dynamically quantised to int8, generation runs under torch.inference_mode and always uses greedy decoding.
+    It can be used wherever the pipeline is expected
+    """
+
+    def __init__(self, summarizer, quantise=True, threads=None, interop_threads=None):
+        """
+        :param summarizer: transformers summarization pipeline
+        :param quantise: whether to quantise the linear layers to int8
+        :param threads: number of threads used within each operation (e.g. a matrix multiplication)
+        :param interop_threads: number of threads used for running independent operations in parallel
+        """
+        import torch
+        if threads:
+            torch.set_num_threads(threads)
+        if interop_threads:
+            try:
+                torch.set_num_interop_threads(interop_threads)
+            except RuntimeError as ex:
+                # It can be set only once, before any parallel work is started
+                logging.warning("Unable to set the number of inter-op threads")
+                logging.warning(ex)
+        summarizer.model.eval()
+        if quantise:
+            summarizer.model = torch.quantization.quantize_dynamic(summarizer.model,
+                                                                   {torch.nn.Linear},
+                                                                   dtype=torch.qint8)
+        self.summarizer = summarizer
+        self.model = summarizer.model
+        self.tokenizer = summarizer.tokenizer
+
+    def __call__(self, texts, **kwargs):
+        import torch
+        kwargs.pop('early_stopping', None)
+        kwargs.update(GREEDY_GENERATION_KWARGS)
+        with torch.inference_mode():
+            return self.summarizer(texts, **kwargs)
+
+
+def load_transformer_model(model_name: str, model_id=None, cpu_mode=False, threads=None, interop_threads=None):
     """
     Load the appropriate transformer model
     :param model_name: whether to load BART model or T5 model
+    :param model_id: Hugging Face checkpoint (or local directory) to load. If None, the default one of model_name
+    :param cpu_mode: whether to optimise the model for CPU-only machines (see CPUSummarizer)
+    :param threads: number of threads used within each operation, only with cpu_mode
+    :param interop_threads: number of threads used for running independent operations in parallel, only with cpu_mode
     :return:
     """
     model = None
     # Load library only if expressly specified: in this way it isn't mandatory to install transformers
     from transformers import pipeline
-    if model_name == "bart":
-        model = pipeline('summarization')
-    elif model_name == "t5":
-        model = pipeline(task='summarization', model="t5-small")
+    if model_name == "bart" or model_name == "t5":
+        model = pipeline(task='summarization', model=model_id or DEFAULT_MODEL_IDS[model_name])
+        if cpu_mode:
+            model = CPUSummarizer(model, threads=threads, interop_threads=interop_threads)
     return model
 
 
@@ -32,4 +85,102 @@ def generate_transformers_summary(text, summarizer):
     summary = summarizer(text, max_length=300, early_stopping=True, num_beams=1)
     summary = summary[0]['summary_text']
     logging.info("generate_transformers_summary <<<")
-    return summary
\ No newline at end of file
+    return summary
+
+
+def generate_transformers_summaries(texts, summarizer, batch_size=8):
+    """
+    Given a transformer pipeline (BART or T5), generate the summaries of several texts at once.
+    Texts are sorted by length and summarised in batches, so that texts in the same batch need little padding
+    :param texts: list of texts to summarise, each one being a list of sentences
+    :param summarizer: transformers pipeline to use for summarising texts
+    :param batch_size: maximum number of texts summarised at the same time
+    :return: list of summaries, in the same order of texts. A summary is None if it couldn't be generated
+    """
+    logging.info("generate_transformers_summaries >>>")
+    # Transform the texts back into strings
+    texts = ["".join(text) for text in texts]
+    summaries = [None] * len(texts)
+    # Number of characters is used as a cheap approximation of the number of tokens
+    sorted_indices = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    batch_size = max(1, batch_size)
+    for start in range(0, len(sorted_indices), batch_size):
+        batch = sorted_indices[start:start + batch_size]
+        try:
+            outputs = summarizer([texts[i] for i in batch],
+                                 max_length=300,
+                                 early_stopping=True,
+                                 num_beams=1,
+                                 batch_size=len(batch))
+        except Exception as ex:
+            # Summarise texts one by one, so that a single faulty text doesn't affect the whole batch
+            logging.error("Unable to summarise a batch of {} texts".format(len(batch)))
+            logging.error(ex)
+            outputs = []
+            for i in batch:
+                try:
+                    outputs.append(summarizer(texts[i], max_length=300, early_stopping=True, num_beams=1)[0])
+                except Exception as text_ex:
+                    logging.error(text_ex)
+                    outputs.append(None)
+        for i, output in zip(batch, outputs):
+            if isinstance(output, list):
+                output = output[0]
+            summaries[i] = output['summary_text'] if output else None
+    logging.info("generate_transformers_summaries <<<")
+    return summaries
+
+
+def count_tokens(text: str, summarizer):
+    """
+    Return the number of tokens of the given text according to the tokenizer of the pipeline.
+    If the pipeline has no tokenizer, words are counted instead
+    :param text: text to evaluate
+    :param summarizer: transformers pipeline to use for summarising text
+    :return:
+    """
+    tokenizer = getattr(summarizer, 'tokenizer', None)
+    if tokenizer is None:
+        return len(text.split())
+    return len(tokenizer(text, add_special_tokens=False)['input_ids'])
+
+
+def get_max_input_tokens(summarizer, default_max_tokens=512, margin=16):
+    """
+    Return the maximum number of tokens the model of the pipeline can process at once
+    :param summarizer: transformers pipeline to use for summarising text
+    :param default_max_tokens: value to use if the tokenizer doesn't specify it
+    :param margin: number of tokens reserved for special tokens and task prefixes (e.g. "summarize: " for T5)
+    :return:
+    """
+    tokenizer = getattr(summarizer, 'tokenizer', None)
+    max_tokens = getattr(tokenizer, 'model_max_length', default_max_tokens)
+    # Tokenizers without a limit use a huge sentinel value
+    if not max_tokens or max_tokens > 100000:
+        max_tokens = default_max_tokens
+    return max(1, max_tokens - margin)
+
+
+def split_sentences_into_chunks(sentences, summarizer, max_tokens: int):
+    """
+    Group consecutive sentences into chunks whose number of tokens doesn't exceed max_tokens.
+    A sentence longer than max_tokens makes a chunk on its own, which will be truncated by the pipeline
+    :param sentences: list of sentences
+    :param summarizer: transformers pipeline whose tokenizer is used for counting tokens
+    :param max_tokens: maximum number of tokens in a chunk
+    :return: list of chunks, each one being the sentences joined by a space
+    """
+    chunks = []
+    current_chunk = []
+    current_tokens = 0
+    for sentence in sentences:
+        sentence_tokens = count_tokens(sentence, summarizer)
+        if current_chunk and current_tokens + sentence_tokens > max_tokens:
+            chunks.append(" ".join(current_chunk))
+            current_chunk = []
+            current_tokens = 0
+        current_chunk.append(sentence)
+        current_tokens += sentence_tokens
+    if current_chunk:
+        chunks.append(" ".join(current_chunk))
+    return chunks
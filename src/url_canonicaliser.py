@@ -0,0 +1,48 @@
+"""
+This module contains the function for computing the canonical form of an article URL, so that the same article
+is recognised even when it's linked by several feeds or with different tracking parameters
+"""
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+# Query parameters added by feeds, newsletters and social networks for tracking where readers come from.
+# Generic names (e.g. source, ref) are kept, since some websites use them for selecting the content of the page
+TRACKING_PARAMETERS = {"fbclid", "gclid", "dclid", "msclkid", "igshid", "mc_cid", "mc_eid", "_ga"}
+TRACKING_PARAMETER_PREFIXES = ("utm_",)
+
+
+def is_tracking_parameter(name: str):
+    """
+    Check if the given query parameter is only used for tracking readers
+    :param name: name of the query parameter
+    :return:
+    """
+    return name in TRACKING_PARAMETERS or name.lower().startswith(TRACKING_PARAMETER_PREFIXES)
+
+
+def canonicalise_url(url: str):
+    """
+    Return the canonical form of the given URL: scheme and host are lowercase, default ports, fragment and
+    tracking parameters are removed and the remaining query parameters are sorted
+    :param url: URL address
+    :return:
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").rstrip(".")
+    if ":" in host:
+        # IPv6 addresses are enclosed in brackets, otherwise they couldn't be told apart from the port
+        host = "[{}]".format(host)
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host
+    if port is not None and DEFAULT_PORTS.get(scheme) != port:
+        netloc = "{}:{}".format(host, port)
+    if parts.username:
+        credentials = parts.username if parts.password is None else "{}:{}".format(parts.username, parts.password)
+        netloc = "{}@{}".format(credentials, netloc)
+    query = sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if not is_tracking_parameter(name))
+    return urlunsplit((scheme, netloc, parts.path or "/", urlencode(query), ""))
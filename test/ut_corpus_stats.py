@@ -0,0 +1,40 @@
+import unittest
+import sys
+sys.path.insert(1, "../src/")
+from src.corpus_stats import DocumentFrequencyStore
+import numpy as np
+import os
+
+
+class CorpusStatsUT(unittest.TestCase):
+    store_fn = "test_document_frequencies.npz"
+
+    def tearDown(self):
+        if os.path.exists(self.store_fn):
+            os.remove(self.store_fn)
+
+    def test_document_frequencies(self):
+        store = DocumentFrequencyStore(n_features=8)
+        store.add_document([1, 2, 2])
+        store.add_document([2, 5])
+        self.assertEqual(2, store.n_documents)
+        self.assertEqual([0, 1, 2, 0, 0, 1, 0, 0], store.document_frequencies.tolist(),
+                         "Words are counted once per document")
+        # Same smoothing of TfidfTransformer
+        self.assertTrue(np.allclose([np.log(3 / 2) + 1, 1.0, np.log(3) + 1], store.get_idf([1, 2, 0])))
+
+    def test_save_and_load(self):
+        store = DocumentFrequencyStore.load(self.store_fn, n_features=8)
+        self.assertEqual(0, store.n_documents, "A new store is created if the file doesn't exist")
+        store.add_document([3])
+        store.save(self.store_fn)
+        loaded_store = DocumentFrequencyStore.load(self.store_fn)
+        self.assertEqual(8, loaded_store.n_features)
+        self.assertEqual(1, loaded_store.n_documents)
+        self.assertTrue(np.array_equal(store.document_frequencies, loaded_store.document_frequencies))
+        loaded_store.add_document([3])
+        self.assertEqual(2, loaded_store.document_frequencies[3], "Loaded statistics can be updated")
+
+
+if __name__ == '__main__':
+    unittest.main()
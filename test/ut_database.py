@@ -1,4 +1,6 @@
 import unittest
+import sys
+sys.path.insert(1, "../src/")
 import src.database_io as database_io
 import os
 
@@ -22,6 +24,25 @@ class DatabaseIOUT(unittest.TestCase):
                          database_io.get_delta([], self.new_articles),
                          "If there aren't old articles the delta must be equal to the new articles")
 
+    def test_get_delta_with_changed_title(self):
+        summarised_articles = [{'title': "pippo", 'url': "https://i.com", 'summary': "ciao", 'sent': True}]
+        current_articles = [{'title': "pippo", 'url': "https://i.com", 'source': "TheGuardian"},
+                            {'title': "pippo v2", 'url': "https://i.com", 'source': "TheGuardian"}]
+        self.assertEqual([current_articles[1]],
+                         database_io.get_delta(summarised_articles, current_articles),
+                         "An article whose title has changed is considered new")
+
+    def test_get_delta_with_canonical_urls(self):
+        summarised_articles = [{'title': "pippo", 'url': "https://i.com/a?utm_source=rss", 'summary': "ciao",
+                                'sent': True},
+                               {'title': "abc", 'url': "https://i.com/b", 'canonical_url': "https://i.com/b",
+                                'summary': "ciao", 'sent': True}]
+        current_articles = [{'title': "pippo", 'url': "https://i.com/a?utm_source=twitter", 'source': "TheGuardian"},
+                            {'title': "abc", 'url': "https://i.com/b#top", 'canonical_url': "https://i.com/b",
+                             'source': "TheGuardian"}]
+        self.assertEqual([], database_io.get_delta(summarised_articles, current_articles),
+                         "Articles already summarised with different tracking parameters are not new")
+
     def test_get_not_sent_summaries(self):
         before_sending = [
             {
@@ -75,6 +96,44 @@ class DatabaseIOUT(unittest.TestCase):
                          "The sent field is correctly updated")
         os.remove("test_update.json")
 
+    def test_failed_batch_is_not_written(self):
+        database_io.insert_items_in_db(self.old_articles, "test_batch.json", "articles")
+        # The second item has no url, therefore the batch fails after the first item has been processed
+        with self.assertRaises(KeyError):
+            database_io.insert_items_in_db([{'title': "new", 'url': "http://truth.abc"}, {'title': "broken"}],
+                                           "test_batch.json", "articles")
+        self.assertEqual(self.old_articles, database_io.retrieve_items_from_db("test_batch.json", "articles"),
+                         "A failed batch leaves the DB untouched")
+        os.remove("test_batch.json")
+
+    def test_sqlite_backend(self):
+        articles = [{'title': "pippo", 'url': "https://i.com", "summary": "ciao", "sent": False},
+                    {'title': "abc", 'url': "http://google.xyz", "summary": "hello", "sent": False}]
+        database_io.insert_items_in_db(articles, "test.sqlite", "articles")
+        database_io.insert_items_in_db(articles, "test.sqlite", "articles")
+        self.assertEqual(articles, database_io.retrieve_items_from_db("test.sqlite", "articles"),
+                         "articles are not added multiple times")
+        database_io.insert_items_in_db([{'url': 'https://i.com'}], "test.sqlite", "sent_articles")
+        self.assertEqual([articles[1]], database_io.retrieve_items_from_db("test.sqlite", "sent_articles"),
+                         "The sent field is correctly updated")
+        for fn in os.listdir("."):
+            if fn.startswith("test.sqlite"):
+                os.remove(fn)
+
+    def test_migrate_tinydb_to_sqlite(self):
+        database_io.insert_items_in_db(self.old_articles, "test_migration.json", "articles")
+        migrated_items = database_io.migrate_tinydb_to_sqlite("test_migration.json", "test_migration.sqlite")
+        self.assertEqual(len(self.old_articles), migrated_items)
+        self.assertEqual(self.old_articles, database_io.retrieve_items_from_db("test_migration.sqlite", "articles"),
+                         "All the articles are migrated")
+        with self.assertRaises(ValueError, msg="A DB already containing items is not filled again"):
+            database_io.migrate_tinydb_to_sqlite("test_migration.json", "test_migration.sqlite")
+        self.assertEqual(self.old_articles, database_io.retrieve_items_from_db("test_migration.sqlite", "articles"),
+                         "Migrating twice doesn't duplicate the articles")
+        for fn in os.listdir("."):
+            if fn.startswith("test_migration"):
+                os.remove(fn)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+import sys
+sys.path.insert(1, "../src/")
+import src.embeddings as embeddings
+import numpy as np
+import os
+
+
+class EmbeddingsUT(unittest.TestCase):
+    text_model = {"the": [0.1, 0.2, 0.3],
+                  "queen": [-1.5, 0.25, 3.0],
+                  "khaled": [0.0, 0.0, 1.0]}
+
+    def setUp(self):
+        with open("test_embedding.txt", "w") as f:
+            for word, vector in self.text_model.items():
+                f.write("{} {}\n".format(word, " ".join(str(v) for v in vector)))
+
+    def tearDown(self):
+        for fn in ("test_embedding.txt", "test_embedding.npy", "test_embedding.vocab", "test_embedding.scales.npy"):
+            if os.path.exists(fn):
+                os.remove(fn)
+
+    def test_binary_embedding(self):
+        self.assertEqual(3, embeddings.convert_text_embedding("test_embedding.txt", "test_embedding"))
+        model = embeddings.load_binary_embedding("test_embedding.npy")
+        self.assertEqual(list(self.text_model.keys()), list(model.keys()), "Words keep their order")
+        for word, vector in self.text_model.items():
+            self.assertTrue(np.array_equal(np.asarray(vector, "float32"), model[word]),
+                            "Vectors are the same of the text model")
+        self.assertFalse("king" in model.keys())
+        with self.assertRaises(KeyError):
+            model["king"]
+
+    def test_compact_embedding(self):
+        model = embeddings.load_text_embedding("test_embedding.txt")
+        compact_model, report = embeddings.compact_embedding(model, {"khaled"}, 1, "int8")
+        self.assertEqual(["the", "khaled"], list(compact_model.keys()),
+                         "Most frequent words and corpus words are kept")
+        self.assertTrue(report['compact_bytes'] < report['original_bytes'])
+        embeddings.save_binary_embedding(compact_model, "test_embedding")
+        loaded_model = embeddings.load_binary_embedding("test_embedding")
+        for word in ("the", "khaled"):
+            self.assertTrue(np.allclose(model[word], loaded_model[word], atol=0.01),
+                            "Quantised vectors are close to the original ones")
+        self.assertTrue(report['mean_cosine_similarity'] > 0.99)
+
+
+if __name__ == '__main__':
+    unittest.main()
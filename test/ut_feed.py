@@ -0,0 +1,102 @@
+import unittest
+from unittest import mock
+import sys
+import os
+import time
+sys.path.insert(1, "../src/")
+import src.feed as feed
+
+
+class FeedUT(unittest.TestCase):
+    news_dict = {"Broken": {'rss': "https://broken.xyz/rss"},
+                 "TheGuardian": {'rss': "https://i.com/rss"},
+                 "Khaled": {'rss': "http://google.xyz/rss"}}
+    feed_cache_fn = "test_feed_cache.json"
+
+    def tearDown(self):
+        if os.path.exists(self.feed_cache_fn):
+            os.remove(self.feed_cache_fn)
+
+    @staticmethod
+    def fake_feed(feed_name, website, articles_infos, timeout, validators=None):
+        if website == "Broken":
+            raise ConnectionError("Feed not available")
+        articles_infos.append({'title': website, 'url': feed_name, 'source': website})
+        return articles_infos
+
+    def test_failing_feed_does_not_abort_the_others(self):
+        with mock.patch.object(feed, "get_website_article_link_title", side_effect=self.fake_feed):
+            articles = feed.get_feeds_articles(self.news_dict, [], max_workers=3, timeout=1)
+        self.assertEqual(["TheGuardian", "Khaled"], [a['source'] for a in articles],
+                         "Articles of working feeds are returned following websites.json order")
+
+    def test_not_modified_feed_is_not_parsed(self):
+        validators = {"https://i.com/rss": {'rss': "https://i.com/rss", 'etag': '"abc"', 'modified': None,
+                                            'entries': [{'title': "A", 'url': "https://i.com/a"}]}}
+        not_modified = mock.MagicMock(status_code=304)
+        not_modified.__enter__.return_value = not_modified
+        with mock.patch.object(feed.requests, "get", return_value=not_modified) as get, \
+                mock.patch.object(feed.feedparser, "parse") as parse:
+            articles = feed.get_website_article_link_title("https://i.com/rss", "TheGuardian", [], 1, validators)
+        self.assertEqual([{'title': "A", 'url': "https://i.com/a", 'source': "TheGuardian"}], articles,
+                         "A not modified feed returns the entries of the last poll")
+        self.assertEqual('"abc"', get.call_args.kwargs['headers']['If-None-Match'], "ETag is sent back")
+        parse.assert_not_called()
+
+    def test_not_summarised_entries_of_not_modified_feed_are_retried(self):
+        feed.database_io.insert_items_in_db([{'rss': "https://i.com/rss", 'etag': '"abc"', 'modified': None,
+                                              'entries': [{'title': "A", 'url': "https://i.com/a"},
+                                                          {'title': "B", 'url': "https://i.com/b"}]}],
+                                            self.feed_cache_fn, "feeds")
+        old_articles = [{'title': "A", 'url': "https://i.com/a", 'summary': "ciao"}]
+        not_modified = mock.MagicMock(status_code=304)
+        not_modified.__enter__.return_value = not_modified
+        with mock.patch.object(feed.requests, "get", return_value=not_modified):
+            articles = feed.get_feeds_articles({"TheGuardian": {'rss': "https://i.com/rss"}}, old_articles,
+                                               feed_cache_fn=self.feed_cache_fn)
+        self.assertEqual(["B"], [a['title'] for a in articles],
+                         "Articles not summarised in the last run are returned even if the feed has not changed")
+
+    def test_feed_without_stored_entries_is_downloaded(self):
+        validators = {"https://i.com/rss": {'rss': "https://i.com/rss", 'etag': '"abc"', 'modified': None}}
+        with mock.patch.object(feed.requests, "get") as get, mock.patch.object(feed.feedparser, "parse"):
+            feed.get_website_article_link_title("https://i.com/rss", "TheGuardian", [], 1, validators)
+        self.assertEqual({}, get.call_args.kwargs['headers'], "Validators without entries are not sent")
+
+    def test_duplicated_articles_are_removed(self):
+        articles = [{'title': "A", 'url': "https://i.com/a?utm_source=rss", 'source': "TheGuardian"},
+                    {'title': "B", 'url': "https://i.com/b", 'source': "TheGuardian"},
+                    {'title': "A", 'url': "https://I.com/a#top", 'source': "Khaled"},
+                    {'title': "A v2", 'url': "https://i.com/a", 'source': "Khaled"}]
+        unique_articles = feed.remove_duplicated_articles(articles)
+        self.assertEqual(["A", "B", "A v2"], [a['title'] for a in unique_articles],
+                         "Articles with the same URL but a different title are kept, as in get_delta")
+        self.assertEqual("TheGuardian", unique_articles[0]['source'], "The first occurrence is kept")
+        self.assertEqual("https://i.com/a", unique_articles[0]['canonical_url'])
+
+    def test_feed_is_parsed_with_its_headers(self):
+        response = mock.MagicMock(status_code=200, headers={'Content-Type': "application/rss+xml; charset=iso-8859-1"})
+        response.__enter__.return_value = response
+        response.iter_content.return_value = [b"<rss>", b"</rss>"]
+        with mock.patch.object(feed.requests, "get", return_value=response), \
+                mock.patch.object(feed.feedparser, "parse") as parse:
+            feed.get_website_article_link_title("https://i.com/rss", "TheGuardian", [], 1)
+        self.assertEqual(b"<rss></rss>", parse.call_args.args[0])
+        self.assertEqual(response.headers, parse.call_args.kwargs['response_headers'],
+                         "Headers are used for detecting the feed encoding")
+
+    def test_slow_feed_is_aborted(self):
+        def slow_chunks():
+            for _ in range(100):
+                time.sleep(0.02)
+                yield b"<rss>"
+        response = mock.MagicMock(status_code=200)
+        response.__enter__.return_value = response
+        response.iter_content.return_value = slow_chunks()
+        with mock.patch.object(feed.requests, "get", return_value=response):
+            with self.assertRaises(TimeoutError, msg="The whole download must end within the timeout"):
+                feed.get_website_article_link_title("https://i.com/rss", "TheGuardian", [], 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
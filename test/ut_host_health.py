@@ -0,0 +1,63 @@
+import unittest
+import sys
+sys.path.insert(1, "../src/")
+from src.host_health import HostHealthTracker
+
+
+class HostHealthUT(unittest.TestCase):
+    host = "www.wired.co.uk"
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        health = HostHealthTracker(failure_threshold=3, cool_down_seconds=600)
+        health.record_failure(self.host)
+        health.record_success(self.host, 0.5)
+        health.record_failure(self.host)
+        health.record_failure(self.host)
+        self.assertTrue(health.is_available(self.host), "Failures are not consecutive")
+        health.record_failure(self.host)
+        self.assertFalse(health.is_available(self.host), "Host is skipped until the cool-down has passed")
+        self.assertTrue(health.is_available("www.politico.eu"), "Other hosts are not affected")
+        report = health.get_report()[self.host]
+        self.assertEqual(5, report['requests'])
+        self.assertAlmostEqual(0.8, report['error_rate'])
+        self.assertTrue(report['circuit_open'])
+
+    def test_single_request_after_cool_down(self):
+        health = HostHealthTracker(failure_threshold=1, cool_down_seconds=0)
+        health.record_failure(self.host)
+        self.assertTrue(health.is_available(self.host), "A request is attempted after the cool-down")
+        self.assertFalse(health.is_available(self.host), "Only one request is attempted")
+        health.record_failure(self.host)
+        self.assertTrue(health.get_report()[self.host]['circuit_open'], "A failed attempt opens the circuit again")
+        self.assertTrue(health.is_available(self.host))
+        health.record_success(self.host, 0.1)
+        self.assertFalse(health.get_report()[self.host]['circuit_open'], "A successful attempt closes the circuit")
+        self.assertTrue(health.is_available(self.host))
+        self.assertTrue(health.is_available(self.host))
+
+    def test_end_trial(self):
+        health = HostHealthTracker(failure_threshold=1, cool_down_seconds=0)
+        health.record_failure(self.host)
+        self.assertTrue(health.is_available(self.host))
+        self.assertFalse(health.is_available(self.host))
+        health.end_trial(self.host)
+        self.assertTrue(health.get_report()[self.host]['circuit_open'], "The circuit stays open")
+        self.assertTrue(health.is_available(self.host), "Another request can be attempted")
+
+    def test_timeout_depends_on_latency(self):
+        health = HostHealthTracker(default_timeout=3, min_timeout=1, max_timeout=10, min_samples=5)
+        for _ in range(4):
+            health.record_success(self.host, 0.2)
+        self.assertEqual(3, health.get_timeout(self.host), "Default timeout is used until enough latencies are known")
+        health.record_success(self.host, 0.2)
+        self.assertEqual(1, health.get_timeout(self.host), "Timeout is never lower than the minimum")
+        for _ in range(20):
+            health.record_success(self.host, 2)
+        self.assertAlmostEqual(4, health.get_timeout(self.host))
+        for _ in range(20):
+            health.record_success(self.host, 30)
+        self.assertEqual(10, health.get_timeout(self.host), "Timeout is never higher than the maximum")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+import sys
+sys.path.insert(1, "../src/")
+import src.model_registry as model_registry
+import os
+
+
+class ModelRegistryUT(unittest.TestCase):
+    store_fns = ["test_idf_{}.npz".format(i) for i in range(3)]
+
+    def tearDown(self):
+        for fn in self.store_fns:
+            if os.path.exists(fn):
+                os.remove(fn)
+
+    def test_models_are_loaded_once(self):
+        registry = model_registry.ModelRegistry()
+        settings = {'algorithm': 'tf_idf', 'idf_store_path': self.store_fns[0]}
+        model = registry.get_model(settings)
+        self.assertIs(model, registry.get_model(dict(settings)), "Loaded models are reused")
+        self.assertIsNot(model, registry.get_model(dict(settings, idf_store_path=self.store_fns[1])),
+                         "Models are identified by algorithm and model id")
+
+    def test_least_recently_used_model_is_evicted(self):
+        # Each document frequencies store uses 4 MB
+        registry = model_registry.ModelRegistry(memory_budget_mb=10)
+        settings = [{'algorithm': 'tf_idf', 'idf_store_path': fn} for fn in self.store_fns]
+        first_model = registry.get_model(settings[0])
+        registry.get_model(settings[1])
+        registry.get_model(settings[0])
+        registry.get_model(settings[2])
+        self.assertEqual([('tf_idf', self.store_fns[0]), ('tf_idf', self.store_fns[2])], list(registry.models.keys()))
+        self.assertTrue(os.path.exists(self.store_fns[1]), "Statistics of evicted models are saved")
+        self.assertIs(first_model, registry.get_model(settings[0]))
+
+    def test_get_model_key(self):
+        self.assertEqual(("t5", "t5-small"), model_registry.get_model_key({'algorithm': 't5'}))
+        self.assertEqual(("bart", "my-bart"), model_registry.get_model_key({'algorithm': 'bart',
+                                                                          'transformers_model_ids': {'bart': 'my-bart'}}))
+
+
+if __name__ == '__main__':
+    unittest.main()
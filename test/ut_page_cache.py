@@ -0,0 +1,83 @@
+import unittest
+import sys
+sys.path.insert(1, "../src/")
+from src.page_cache import PageCache
+import os
+import shutil
+import time
+from unittest import mock
+
+
+class PageCacheUT(unittest.TestCase):
+    cache_dir = "test_page_cache"
+    url = "https://www.wired.co.uk/article/big-tech-geopolitics"
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_get_and_put(self):
+        cache = PageCache(self.cache_dir)
+        self.assertIsNone(cache.get(self.url))
+        cache.put(self.url, b"<html>page</html>")
+        self.assertEqual(b"<html>page</html>", cache.get(self.url))
+        self.assertEqual(b"<html>page</html>", cache.get(self.url + "#comments"), "Fragments are ignored")
+        self.assertIsNone(cache.get(self.url + "?page=2"))
+
+    def test_expired_page(self):
+        cache = PageCache(self.cache_dir, ttl_seconds=60)
+        cache.put(self.url, b"<html>page</html>")
+        self.assertIsNotNone(cache.get(self.url))
+        old_time = time.time() - 120
+        os.utime(cache.get_filename(self.url), (old_time, old_time))
+        self.assertIsNone(cache.get(self.url), "Pages older than the time to live are not returned")
+
+    def test_eviction(self):
+        cache = PageCache(self.cache_dir)
+        for i in range(3):
+            cache.put("{}/{}".format(self.url, i), os.urandom(1000))
+            fetch_time = time.time() - 100 + i
+            os.utime(cache.get_filename("{}/{}".format(self.url, i)), (fetch_time, fetch_time))
+        cache.max_bytes = 2500
+        cache.evict()
+        self.assertIsNone(cache.get(self.url + "/0"), "The least recently downloaded page is evicted")
+        self.assertIsNotNone(cache.get(self.url + "/1"))
+        self.assertIsNotNone(cache.get(self.url + "/2"))
+
+    def test_put_evicts_only_when_too_big(self):
+        cache = PageCache(self.cache_dir, max_bytes=2500)
+        with mock.patch("src.page_cache.os.scandir", wraps=os.scandir) as scandir:
+            for i in range(2):
+                cache.put("{}/{}".format(self.url, i), os.urandom(1000))
+            cache.put("{}/{}".format(self.url, 1), os.urandom(1000))
+            self.assertEqual(0, scandir.call_count, "The cache directory isn't scanned while the cache is small")
+            cache.put("{}/{}".format(self.url, 2), os.urandom(1000))
+            self.assertEqual(1, scandir.call_count)
+        self.assertTrue(cache.total_bytes <= 2500)
+        self.assertEqual(cache.total_bytes, sum(os.path.getsize(os.path.join(self.cache_dir, name))
+                                                for name in os.listdir(self.cache_dir)))
+
+    def test_failed_put(self):
+        cache = PageCache(self.cache_dir)
+        with mock.patch("src.page_cache.os.replace", side_effect=OSError("No space left on device")):
+            cache.put(self.url, b"<html>page</html>")
+        self.assertIsNone(cache.get(self.url))
+        self.assertEqual([], os.listdir(self.cache_dir), "Temporary files are removed")
+
+    def test_stale_temporary_files_are_removed(self):
+        cache = PageCache(self.cache_dir)
+        for name, age in [("stale.tmp", 7200), ("recent.tmp", 10)]:
+            with open(os.path.join(self.cache_dir, name), "wb") as f:
+                f.write(b"partial page")
+            write_time = time.time() - age
+            os.utime(os.path.join(self.cache_dir, name), (write_time, write_time))
+        cache.evict()
+        self.assertEqual(["recent.tmp"], os.listdir(self.cache_dir),
+                         "Only temporary files that may still be written are kept")
+
+    def test_invalid_max_bytes(self):
+        with self.assertRaises(ValueError):
+            PageCache(self.cache_dir, max_bytes=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,11 @@ import unittest
 import sys
 sys.path.insert(1, "../")
 import src.scraper as scraper
+from src.host_health import HostHealthTracker
 import json
+import threading
+import time
+from unittest import mock
 
 
 class ScraperUT(unittest.TestCase):
@@ -52,6 +56,93 @@ class ScraperUT(unittest.TestCase):
         page = scraper.scrape_page(self.politico_url, self.politico_div_class, 5, 0)
         self.assertTrue(len(page) > 0)
 
+    def test_scrape_pages_limits_concurrency_per_host(self):
+        website_infos = {"A": {'main_class': "a", 'number_of_first_paragraphs_to_ignore': 0,
+                               'number_of_last_paragraphs_to_ignore': 0}}
+        articles = [{'url': "https://a.com/{}".format(i), 'source': "A", 'title': str(i)} for i in range(6)] + \
+                   [{'url': "https://b.com/{}".format(i), 'source': "A", 'title': str(i)} for i in range(2)]
+        running = {}
+        max_running = {}
+        lock = threading.Lock()
+
+        def fake_scrape_page(link, article_class, first_paragraph_index, last_paragraph_index, *args):
+            host = scraper.get_host(link)
+            with lock:
+                running[host] = running.get(host, 0) + 1
+                max_running[host] = max(max_running.get(host, 0), running[host])
+            time.sleep(0.02)
+            with lock:
+                running[host] -= 1
+            if link.endswith("/3"):
+                raise ConnectionError("Page not available")
+            return [link]
+
+        with mock.patch.object(scraper, "scrape_page", side_effect=fake_scrape_page):
+            results = list(scraper.scrape_pages(articles, website_infos, max_workers=4, max_workers_per_host=2))
+        self.assertEqual(len(articles), len(results), "Each article is yielded once")
+        self.assertEqual(2, max_running["a.com"], "At most 2 pages of the same host are downloaded at once")
+        for article, text in results:
+            self.assertEqual([] if article['url'].endswith("/3") else [article['url']], text)
+
+    def test_get_session(self):
+        self.assertIs(scraper.get_session("a.com"), scraper.get_session("a.com"), "Sessions are reused")
+        self.assertIsNot(scraper.get_session("a.com"), scraper.get_session("b.com"))
+
+    def test_get_article_paragraphs(self):
+        page = b"<html><body><p>Menu</p><div class='article body'><p>First</p><div><p>Second</p></div></div>" \
+               b"<div class='footer'><p class='body'>Footer</p></div></body></html>"
+        for parser in ("html.parser", "lxml"):
+            paragraphs = scraper.get_article_paragraphs(page, "article body", self.wired_url, parser)
+            self.assertEqual(["First", "Second"], [p.get_text() for p in paragraphs])
+            paragraphs = scraper.get_article_paragraphs(page, "body", self.wired_url, parser)
+            self.assertEqual(["First", "Second"], [p.get_text() for p in paragraphs],
+                             "Divs having the class among others are found")
+            paragraphs = scraper.get_article_paragraphs(page.replace(b"<div class='article body'>", b"<div>"),
+                                                        "body", self.wired_url, parser)
+            self.assertEqual(["Footer"], [p.get_text() for p in paragraphs], "Paragraphs with the class are a fallback")
+
+    def test_download_page_bigger_than_max_bytes(self):
+        page = mock.MagicMock(headers={}, status_code=200)
+        page.__enter__.return_value = page
+        page.iter_content.return_value = [b"a" * 10] * 3
+        session = mock.Mock()
+        session.get.return_value = page
+        self.assertEqual(b"a" * 30, scraper.download_page(self.wired_url, session, max_bytes=30))
+        self.assertIsNone(scraper.download_page(self.wired_url, session, max_bytes=25),
+                          "Download is aborted as soon as the page is too big")
+        page.headers = {'Content-Length': "100"}
+        self.assertIsNone(scraper.download_page(self.wired_url, session, max_bytes=50))
+
+    def test_scrape_page_with_cache(self):
+        page = b"<html><body><div class='body'><p>First</p><p>Second</p></div></body></html>"
+        cache = mock.Mock()
+        cache.get.return_value = None
+        with mock.patch.object(scraper, "download_page", return_value=page) as download_page:
+            self.assertEqual(["First", "Second"], scraper.scrape_page(self.wired_url, "body", 0, 0, cache=cache))
+            cache.put.assert_called_once_with(self.wired_url, page)
+            cache.get.return_value = page
+            self.assertEqual(["Second"], scraper.scrape_page(self.wired_url, "body", 1, 0, cache=cache))
+            self.assertEqual(1, download_page.call_count, "Stored pages are not downloaded again")
+
+    def test_unavailable_host_is_skipped(self):
+        health = HostHealthTracker(failure_threshold=2)
+        with mock.patch.object(scraper, "download_page", side_effect=ConnectionError("Timeout")) as download_page:
+            for _ in range(4):
+                self.assertEqual([], scraper.scrape_page(self.wired_url, "body", 0, 0, health=health))
+        self.assertEqual(2, download_page.call_count, "Articles are skipped once the circuit is open")
+        self.assertEqual(3, download_page.call_args.args[3], "Default timeout is used for unknown hosts")
+
+    def test_page_too_big_is_not_an_outcome(self):
+        health = HostHealthTracker(failure_threshold=1, cool_down_seconds=0)
+        health.record_failure(scraper.get_host(self.wired_url))
+        with mock.patch.object(scraper, "download_page", return_value=None):
+            self.assertIsNone(scraper.download_page_tracking_health(self.wired_url, None, 10, health))
+        report = health.get_report()[scraper.get_host(self.wired_url)]
+        self.assertEqual(1, report['requests'], "Pages too big are neither a success nor a failure")
+        self.assertTrue(report['circuit_open'])
+        self.assertTrue(health.is_available(scraper.get_host(self.wired_url)),
+                        "Another request can be attempted after a page too big")
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -2,6 +2,7 @@ import unittest
 import src.summariser as summariser
 import src.transformers_summaries as transformers_summaries
 import numpy as np
+from src.corpus_stats import DocumentFrequencyStore
 import word_mover_distance.model as model
 
 
@@ -43,6 +44,71 @@ class SummariserUT(unittest.TestCase):
         self.assertEqual(expected_output, summariser.preprocess_text(input_text, self.stopws, self.lemmatiser),
                          "Special characters are removed and lemmatisation is applied")
 
+    def test_text_preprocessor(self):
+        preprocessor = summariser.TextPreprocessor()
+        sentences = ["Hi! My name is Khaled", "@Classes!", "The champions   are playing\tagainst the queen"]
+        self.assertEqual([summariser.preprocess_text(s, self.stopws, self.lemmatiser) for s in sentences],
+                         preprocessor.preprocess_sentences(sentences),
+                         "The preprocessor returns the same output of preprocess_text")
+
+    def test_vocabulary(self):
+        vocabulary = summariser.Vocabulary(self.cosine_model['model_object'].model)
+        sentences_ids = vocabulary.encode_sentences([["queen", "khaled", "queen"], ["r1jd", "queen"]])
+        self.assertEqual([0, 1, 0], list(sentences_ids[0]), "The same word always has the same id")
+        self.assertEqual([2, 0], list(sentences_ids[1]))
+        self.assertTrue(np.array_equal(self.cosine_model['model_object'].model["queen"], vocabulary.vectors[0]),
+                        "Word vectors are looked up in the embedding model")
+        self.assertFalse(vocabulary.in_model[2], "Unknown words are flagged")
+
+    def test_vocabulary_growth(self):
+        model_infos = dict(self.cosine_model)
+        model_infos.pop('vocabulary', None)
+        # Fill the initial capacity, so that the following words are stored in grown arrays
+        known_words = list(self.cosine_model['model_object'].model)[:1100]
+        sentences = [known_words[:1024],
+                     ["r1jd", known_words[1050]],
+                     [known_words[1060], "x9kq", known_words[1070]],
+                     [known_words[1080], known_words[1090]]]
+        matrix = summariser.build_similarity_matrix(sentences, model_infos)
+        vocabulary = summariser.get_vocabulary(model_infos)
+        self.assertFalse(vocabulary.in_model[vocabulary.word_ids["r1jd"]], "Unknown words are flagged")
+        self.assertFalse(np.any(vocabulary.vectors[vocabulary.word_ids["r1jd"]]),
+                         "Unknown words added after growing the vocabulary have a vector of zeros")
+        for i in range(1, len(sentences)):
+            for j in range(1, len(sentences)):
+                if i != j:
+                    self.assertAlmostEqual(summariser.compute_sentence_similarity(sentences[i],
+                                                                                  sentences[j],
+                                                                                  model_infos),
+                                           matrix[i, j], places=5,
+                                           msg="Vectorised and pairwise similarities are the same")
+
+    def test_vocabulary_threads(self):
+        from concurrent.futures import ThreadPoolExecutor
+        vocabulary = summariser.Vocabulary(self.cosine_model['model_object'].model)
+        words = list(self.cosine_model['model_object'].model)[:3000] + ["r1jd", "x9kq"]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            encoded_words = list(executor.map(lambda k: vocabulary.encode(words[k % 3::3] + words[::7]), range(24)))
+        self.assertEqual(len(words), len(vocabulary.words), "Each word is added once")
+        for k, ids in enumerate(encoded_words):
+            self.assertEqual(words[k % 3::3] + words[::7], [vocabulary.words[i] for i in ids])
+        for word in words[:-2]:
+            self.assertTrue(np.array_equal(self.cosine_model['model_object'].model[word],
+                                           vocabulary.vectors[vocabulary.word_ids[word]]),
+                            "Words added by several threads get their own vector")
+
+    def test_get_vocabulary(self):
+        model_infos = dict(self.cosine_model)
+        model_infos.pop('vocabulary', None)
+        vocabulary = summariser.get_vocabulary(model_infos)
+        vocabulary.encode(["queen", "king"])
+        self.assertIs(vocabulary, summariser.get_vocabulary(model_infos), "The vocabulary is shared")
+        self.assertIs(vocabulary, summariser.get_vocabulary(model_infos, max_words=2),
+                      "The vocabulary is kept until it has too many words")
+        new_vocabulary = summariser.get_vocabulary(model_infos, max_words=1)
+        self.assertEqual(0, len(new_vocabulary.words), "A vocabulary with too many words is emptied")
+        self.assertIs(new_vocabulary, summariser.get_vocabulary(model_infos))
+
     def test_split_text_into_sentences(self):
         text = ["Hi to everyone! I am Khaled"]
         expected_output = ["Hi to everyone!", "I am Khaled"]
@@ -66,6 +132,67 @@ class SummariserUT(unittest.TestCase):
         min_length = 3
         self.assertEqual([text[1]], summariser.filter_sentences_by_length(text, min_length))
 
+    def test_build_knn_similarity_matrix(self):
+        sentences = [summariser.preprocess_text(s, self.stopws, self.lemmatiser)
+                     for s in ["Hi, my name is khaled and I love coding!",
+                               "This is an unrelated sentence, what do you think?",
+                               "I really enjoy watching movies with my friends",
+                               "My favourite tv show is made by another khaled"]]
+        dense_matrix = summariser.build_similarity_matrix(sentences, self.cosine_model)
+        sentences_ids = summariser.get_vocabulary(self.cosine_model).encode_sentences(sentences)
+        knn_matrix, kept_sentences = summariser.build_knn_similarity_matrix(sentences_ids, self.cosine_model, 1, 3)
+        self.assertEqual(3, len(kept_sentences), "Only max_sentences sentences are kept")
+        knn_matrix = knn_matrix.toarray()
+        dense_matrix = dense_matrix[np.ix_(kept_sentences, kept_sentences)]
+        self.assertTrue(np.allclose(knn_matrix[knn_matrix > 0], dense_matrix[knn_matrix > 0]),
+                        "Kept edges have the same weights of the dense matrix")
+        self.assertTrue(np.all(np.count_nonzero(knn_matrix, axis=1) >= 1), "Each sentence keeps its strongest edge")
+
+    def test_build_knn_similarity_matrix_unknown_words(self):
+        model_infos = dict(self.cosine_model)
+        model_infos.pop('vocabulary', None)
+        # Unknown words are added after the vocabulary initial capacity is filled
+        known_words = list(self.cosine_model['model_object'].model)[:1100]
+        sentences = [known_words[:1024],
+                     ["r1jd", known_words[1030], known_words[1040]],
+                     [known_words[1050], "x9kq"],
+                     [known_words[1060], known_words[1070], "r1jd"],
+                     [known_words[1080], known_words[1090]]]
+        sentences_ids = summariser.get_vocabulary(model_infos).encode_sentences(sentences)
+        knn_matrix, kept_sentences = summariser.build_knn_similarity_matrix(sentences_ids, model_infos, 2,
+                                                                            len(sentences))
+        knn_matrix = knn_matrix.toarray()
+        for i, j in zip(*np.nonzero(knn_matrix)):
+            self.assertAlmostEqual(summariser.compute_sentence_similarity(sentences[kept_sentences[i]],
+                                                                          sentences[kept_sentences[j]],
+                                                                          model_infos),
+                                   knn_matrix[i, j], places=5,
+                                   msg="Kept edges have the same weights of the pairwise similarities")
+
+    def test_compute_pagerank(self):
+        from scipy.sparse import csr_matrix
+        matrix = np.array([[0, 1, 1, 0],
+                           [1, 0, 1, 0],
+                           [1, 1, 0, 0],
+                           [0, 0, 0, 0]], dtype=float)
+        scores = summariser.compute_pagerank(matrix)
+        self.assertAlmostEqual(1, np.sum(scores), msg="PageRank scores sum to one")
+        self.assertTrue(np.allclose(scores[0], scores[1:3]), "Symmetric nodes have the same score")
+        self.assertTrue(scores[3] < scores[0], "An isolated node has the lowest score")
+        self.assertTrue(np.allclose(scores, summariser.compute_pagerank(csr_matrix(matrix))),
+                        "Dense and sparse matrices lead to the same scores")
+        self.assertTrue(np.allclose(scores, summariser.compute_pagerank(matrix, nstart=scores)),
+                        "Warm starting from the final scores doesn't change them")
+        # Expected scores computed with networkx.pagerank(networkx.from_numpy_array(matrix))
+        matrix = np.array([[0, 0.2, 0.7, 0, 0.1],
+                           [0.2, 0, 0.5, 0.3, 0],
+                           [0.7, 0.5, 0, 0.4, 0.9],
+                           [0, 0.3, 0.4, 0, 0],
+                           [0.1, 0, 0.9, 0, 0]])
+        self.assertTrue(np.allclose([0.163326, 0.168304, 0.382504, 0.124938, 0.160928],
+                                    summariser.compute_pagerank(matrix), atol=1e-5),
+                        "Scores are the same of networkx")
+
     def test_get_sentences_by_score(self):
         text = ["hi, my name is khaled and yours?",
                 "i like watching movies",
@@ -88,6 +215,60 @@ class SummariserUT(unittest.TestCase):
         self.assertEqual(expected_output, scored_sentences,
                          "Check if the summary has the first and third sentence")
 
+    def test_get_sentences_by_score_with_duplicates(self):
+        text = ["the same sentence", "another sentence", "the same sentence", "a last sentence"]
+        scores = [10, 1, 10, 5]
+        scored_sentences = summariser.get_sentences_by_scores(scores=scores,
+                                                              sentences=text,
+                                                              settings={'reduction_factor': 2},
+                                                              maximise_score=True)
+        self.assertEqual([text[0], text[2]], scored_sentences,
+                         "Duplicated sentences are selected according to their own position")
+        scored_sentences = summariser.get_sentences_by_scores(scores=[1, 1, 1, 1],
+                                                              sentences=text,
+                                                              settings={'reduction_factor': 4},
+                                                              maximise_score=True)
+        self.assertEqual([text[0]], scored_sentences, "Ties are broken following the original order")
+
+    def test_tf_idf_summarisation_with_empty_sentence(self):
+        vocabulary = summariser.Vocabulary()
+        sentences_ids = vocabulary.encode_sentences([["coding", "magic"], [], ["movie", "titanic", "movie"]])
+        summary = summariser.tf_idf_summarisation(sentences_ids, ["first.", "second.", "third."],
+                                                  {'reduction_factor': 2}, vocabulary)
+        self.assertEqual("first. third.", summary, "Sentences without words have the lowest score")
+
+    def test_tf_idf_summarisation_with_document_frequencies(self):
+        vocabulary = summariser.Vocabulary()
+        document_frequencies = DocumentFrequencyStore(n_features=2 ** 10)
+        sentences_ids = vocabulary.encode_sentences([["news", "coding"], ["news", "magic"], ["movie", "titanic"]])
+        summary = summariser.tf_idf_summarisation(sentences_ids, ["first.", "second.", "third."],
+                                                  {'reduction_factor': 3}, vocabulary,
+                                                  document_frequencies, update_document_frequencies=True)
+        self.assertEqual("first.", summary, "All the words have the same IDF in the first article")
+        self.assertEqual(1, document_frequencies.n_documents, "The article is added to the statistics")
+        for _ in range(5):
+            document_frequencies.add_document(vocabulary.hashes[vocabulary.encode(["news"])] % 2 ** 10)
+        summary = summariser.tf_idf_summarisation(sentences_ids, ["first.", "second.", "third."],
+                                                  {'reduction_factor': 3}, vocabulary, document_frequencies)
+        self.assertEqual("third.", summary, "Words common to previous articles are less important")
+        self.assertEqual(6, document_frequencies.n_documents)
+
+    def test_create_chunked_transformers_summaries(self):
+        text = ["hi, my name is khaled and yours? i like watching movies.",
+                "the movie i hate the most is titanic and yours?",
+                "I really enjoy coding, I find that its a sort of magic activity."]
+        settings = {'reduction_factor': 2,
+                    'min_words_in_sentence': 1,
+                    'algorithm': 'bart',
+                    'chunk_reduce': 'abstractive',
+                    'chunk_max_tokens': 20}
+        summaries = summariser.create_summaries([text, text[:1]], self.bart_model, settings)
+        self.assertEqual(2, len(summaries))
+        self.assertTrue(all(len(summary) > 0 for summary in summaries))
+        settings['chunk_reduce'] = 'extractive'
+        summaries = summariser.create_summaries([text], self.bart_model, settings)
+        self.assertTrue(len(summaries[0]) > 0)
+
     def test_create_summary(self):
         text = ["hi, my name is khaled and yours?",
                 "i like watching movies",
@@ -184,6 +365,47 @@ class SummariserUT(unittest.TestCase):
         self.assertTrue(score_s1_s2_wmd != score_s1_s2_cos,
                         "Changing distance metric lead to different scores")
 
+    def test_build_cosine_similarity_matrix(self):
+        sentences = [summariser.preprocess_text(s, self.stopws, self.lemmatiser)
+                     for s in ["Hi, my name is khaled and I love coding!",
+                               "This is an unrelated sentence, what do you think?",
+                               "I really enjoy watching movies with my friends"]]
+        matrix = summariser.build_similarity_matrix(sentences, self.cosine_model)
+        for i in range(len(sentences)):
+            for j in range(len(sentences)):
+                if i != j:
+                    self.assertAlmostEqual(summariser.compute_sentence_similarity(sentences[i],
+                                                                                  sentences[j],
+                                                                                  self.cosine_model),
+                                           matrix[i, j],
+                                           places=5,
+                                           msg="The vectorised matrix has the same scores of pairwise comparisons")
+
+    def test_parallel_wmd_similarity_matrix(self):
+        sentences = [summariser.preprocess_text(s, self.stopws, self.lemmatiser)
+                     for s in ["Hi, my name is khaled and I love coding!",
+                               "This is an unrelated sentence, what do you think?",
+                               "I really enjoy watching movies with my friends",
+                               "My favourite tv show is made by another khaled"]]
+        serial_matrix = summariser.build_similarity_matrix(sentences, self.wmd_model)
+        parallel_matrix = summariser.build_similarity_matrix(sentences, dict(self.wmd_model, wmd_workers=2))
+        self.assertTrue(np.array_equal(serial_matrix, parallel_matrix),
+                        "Splitting WMD computation among processes doesn't change the scores")
+        self.assertTrue(np.array_equal(serial_matrix, serial_matrix.T), "The WMD matrix is symmetric")
+
+    def test_wmd_tolerance(self):
+        sentences = [summariser.preprocess_text(s, self.stopws, self.lemmatiser)
+                     for s in ["Hi, my name is khaled and I love coding!",
+                               "This is an unrelated sentence, what do you think?",
+                               "I really enjoy watching movies with my friends",
+                               "My favourite tv show is made by another khaled"]]
+        exact_matrix = summariser.build_similarity_matrix(sentences, self.wmd_model)
+        tolerance = 0.2
+        approximated_matrix = summariser.build_similarity_matrix(sentences,
+                                                                 dict(self.wmd_model, wmd_tolerance=tolerance))
+        self.assertTrue(np.all(np.abs(approximated_matrix - exact_matrix) <= tolerance / 2 * exact_matrix + 1e-6),
+                        "Approximated WMD has a relative error of at most tolerance / 2")
+
     def test_different_empty_strategies(self):
         s1 = "Hi, my name is khaled1242jd hew932nc and I love coding!".split()
         s2 = "This is an unrelated sentence, what do you think ?".split()
@@ -0,0 +1,53 @@
+import unittest
+import sys
+sys.path.insert(1, "../src/")
+import src.transformers_benchmark as transformers_benchmark
+import os
+
+
+def first_words_summarizer(n_words):
+    def summarizer(text, **kwargs):
+        return [{'summary_text': " ".join(text.split()[:n_words])}]
+    return summarizer
+
+
+class TransformersBenchmarkUT(unittest.TestCase):
+    corpus_fn = "test_corpus.txt"
+
+    def setUp(self):
+        with open(self.corpus_fn, "w") as f:
+            f.write("The first article.\nIt has two lines.\n\n\nThe second article has a single line.\n")
+
+    def tearDown(self):
+        if os.path.exists(self.corpus_fn):
+            os.remove(self.corpus_fn)
+
+    def test_load_corpus(self):
+        self.assertEqual([["The first article. ", "It has two lines. "],
+                          ["The second article has a single line. "]],
+                         transformers_benchmark.load_corpus(self.corpus_fn))
+
+    def test_compute_rouge_1(self):
+        self.assertEqual(1.0, transformers_benchmark.compute_rouge_1("The cat", "the cat"))
+        self.assertEqual(0.0, transformers_benchmark.compute_rouge_1("a dog", "the cat"))
+        self.assertAlmostEqual(0.5, transformers_benchmark.compute_rouge_1("the cat", "the cat sat on the mat"))
+
+    def test_compare_summarizers(self):
+        corpus = transformers_benchmark.load_corpus(self.corpus_fn)
+        loaded_summarizers = []
+
+        def load_summarizer(n_words):
+            loaded_summarizers.append(n_words)
+            return first_words_summarizer(n_words)
+        report = transformers_benchmark.compare_summarizers(corpus,
+                                                            lambda: load_summarizer(4),
+                                                            lambda: load_summarizer(2))
+        self.assertEqual(2, report['articles'])
+        self.assertTrue(report['rouge_1_delta'] < 0, "Shorter summaries overlap less with the articles")
+        self.assertTrue(0 < report['rouge_1_agreement'] < 1)
+        self.assertTrue(report['speed_up'] > 0)
+        self.assertEqual([4, 2], loaded_summarizers, "Each summarizer is loaded once, the baseline one first")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+import sys
+sys.path.insert(1, "../src/")
+import src.transformers_summaries as transformers_summaries
+from unittest import mock
+
+
+class FakeSummarizer:
+    """
+    Callable with the same interface of a transformers summarization pipeline, returning the first word of each text
+    """
+
+    def __init__(self, failing_text=None):
+        self.batches = []
+        self.failing_text = failing_text
+
+    def __call__(self, texts, **kwargs):
+        batch = texts if isinstance(texts, list) else [texts]
+        self.batches.append(batch)
+        if self.failing_text in batch:
+            raise ValueError("Unable to summarise text")
+        return [{'summary_text': text.split()[0]} for text in batch]
+
+
+class TransformersSummariesUT(unittest.TestCase):
+    texts = [["Long ", "article with many sentences."],
+             ["Short."],
+             ["Medium ", "article."]]
+
+    def test_batched_summaries(self):
+        summarizer = FakeSummarizer()
+        summaries = transformers_summaries.generate_transformers_summaries(self.texts, summarizer, batch_size=2)
+        self.assertEqual(["Long", "Short.", "Medium"], summaries, "Summaries follow the order of the texts")
+        self.assertEqual([["Short.", "Medium article."], ["Long article with many sentences."]], summarizer.batches,
+                         "Texts with similar length are summarised in the same batch")
+
+    def test_failing_text_in_batch(self):
+        summarizer = FakeSummarizer(failing_text="Short.")
+        summaries = transformers_summaries.generate_transformers_summaries(self.texts, summarizer, batch_size=3)
+        self.assertEqual(["Long", None, "Medium"], summaries, "Only the faulty text has no summary")
+
+    def test_split_sentences_into_chunks(self):
+        sentences = ["one two three.", "four five.", "six seven eight nine.", "ten."]
+        chunks = transformers_summaries.split_sentences_into_chunks(sentences, FakeSummarizer(), max_tokens=5)
+        self.assertEqual(["one two three. four five.", "six seven eight nine. ten."], chunks,
+                         "Consecutive sentences are grouped without exceeding the number of tokens")
+        chunks = transformers_summaries.split_sentences_into_chunks(sentences, FakeSummarizer(), max_tokens=3)
+        self.assertEqual(["one two three.", "four five.", "six seven eight nine.", "ten."], chunks,
+                         "Sentences longer than the limit are not split")
+
+    def test_get_max_input_tokens(self):
+        self.assertEqual(496, transformers_summaries.get_max_input_tokens(FakeSummarizer()))
+        summarizer = FakeSummarizer()
+        summarizer.tokenizer = type("Tokenizer", (), {"model_max_length": 1024})()
+        self.assertEqual(1008, transformers_summaries.get_max_input_tokens(summarizer))
+
+    def test_cpu_summarizer_threads(self):
+        # Only the functions existing in PyTorch are available
+        torch = mock.MagicMock(spec=["set_num_threads", "set_num_interop_threads", "quantization", "nn", "qint8",
+                                     "inference_mode"])
+        summarizer = FakeSummarizer()
+        summarizer.model = mock.Mock()
+        summarizer.tokenizer = None
+        with mock.patch.dict(sys.modules, {"torch": torch}):
+            transformers_summaries.CPUSummarizer(summarizer, threads=4, interop_threads=2)
+        torch.set_num_threads.assert_called_once_with(4)
+        torch.set_num_interop_threads.assert_called_once_with(2)
+        torch.quantization.quantize_dynamic.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,27 @@
+import unittest
+import sys
+sys.path.insert(1, "../src/")
+from src.url_canonicaliser import canonicalise_url
+
+
+class UrlCanonicaliserUT(unittest.TestCase):
+
+    def test_canonicalise_url(self):
+        self.assertEqual("https://www.politico.eu/article/trump/",
+                         canonicalise_url("HTTPS://WWW.Politico.eu:443/article/trump/?utm_source=RSS_Feed&utm_medium=RSS"
+                                          "&utm_campaign=RSS_Syndication "))
+        self.assertEqual("https://hackernoon.com/pomodoro-c8113y06?source=rss",
+                         canonicalise_url("https://hackernoon.com/pomodoro-c8113y06?source=rss#comments"),
+                         "Generic parameters may select the content of the page, therefore they are kept")
+        self.assertEqual("http://i.com:8080/", canonicalise_url("http://i.com:8080"), "Non default ports are kept")
+        self.assertEqual("https://i.com/search?a=1&b=&q=news",
+                         canonicalise_url("https://i.com/search?q=news&fbclid=abc&b=&a=1"),
+                         "Remaining query parameters are sorted")
+        self.assertEqual("https://i.com/Article", canonicalise_url("https://i.com/Article"), "Path case is kept")
+        self.assertEqual("http://[2001:db8::1]:8080/a", canonicalise_url("http://[2001:DB8::1]:8080/a"),
+                         "IPv6 addresses are enclosed in brackets")
+        self.assertEqual("https://[2001:db8::1]/", canonicalise_url("https://[2001:db8::1]:443"))
+
+
+if __name__ == '__main__':
+    unittest.main()